@@ -1,39 +1,147 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response
+import functools
+import math
 from flask_cors import CORS
-import sqlite3
-from datetime import datetime
-import requests
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from telegram_files import PhotoResolver, track_timeouts
+from pagination import BOOKING_CURSOR, ID_CURSOR, NEXT_CURSOR_HEADER, REVIEW_CURSOR, decode_cursor, encode_cursor, parse_booking_filters, parse_limit
+from response_cache import CACHE_CONTROL, CACHED_HEADERS, CATALOG, ResponseCache, cache_key, trainer_tag
+from connections import ConnectionProvider
+from single_flight import SingleFlight
+import schedule_templates
+import metrics
+import rate_limit
+import dashboard
+from serialization import FastJSONProvider
 
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 app = Flask(__name__)
-CORS(app)
+app.json = FastJSONProvider(app)
+# Ответ на preflight (OPTIONS) браузер кэширует на max_age секунд
+# (Chrome — не дольше 2 часов): без него каждый запрос с X-Telegram-Init-Data
+# стоил бы двух обращений к серверу
+CORS_MAX_AGE = 86400
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER, 'ETag', 'Retry-After'], max_age=CORS_MAX_AGE)
 
-DATABASE = 'uniobot.db'
+DATABASE = os.getenv('DATABASE_PATH', 'uniobot.db')
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+photo_resolver = PhotoResolver(BOT_TOKEN)
 
 def get_telegram_file_url(file_id):
-    if not file_id:
-        return None
-    try:
-        resp = requests.get(f'https://api.telegram.org/bot{BOT_TOKEN}/getFile', params={'file_id': file_id})
-        if resp.status_code == 200:
-            file_path = resp.json().get('result', {}).get('file_path')
-            if file_path:
-                return f'https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}'
-    except:
-        pass
-    return None
+    return photo_resolver.resolve(file_id)
+
+from database import BOOKING_STATUSES, Database, SlotNotFound, SlotFull
+if os.getenv('DATABASE_URL'):
+    # SQLAlchemy Core с пулом соединений: PostgreSQL или SQLite по URL
+    from repository import SqlRepository
+    db_helper = SqlRepository(os.getenv('DATABASE_URL'))
+else:
+    db_helper = Database(DATABASE, ConnectionProvider(DATABASE, factory=metrics.connection_factory()))
+
+if os.getenv('JOBS_IN_PROCESS') == '1':
+    # Только для одного процесса; под gunicorn — python manage.py jobs
+    import jobs
+    jobs.JobRunner(db_helper).start()
+
+response_cache = ResponseCache(ttl=int(os.getenv('RESPONSE_CACHE_TTL', '60')))
+db_helper.add_listener(response_cache.on_database_change)
+single_flight = SingleFlight()
+rate_limiter = rate_limit.from_env(BOT_TOKEN)
+
+def render(view, kwargs):
+    # Ответ как данные (тело, статус, заголовки): его разделяют запросы,
+    # схлопнутые single_flight, а объект Response у каждого свой
+    response = make_response(view(**kwargs))
+    return response.get_data(), response.status_code, response.headers.to_wsgi_list()
+
+def coalesced(view):
+    # Одинаковые одновременные запросы выполняют view один раз
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        key = cache_key(request.path, request.args.items(multi=True))
+        body, status, headers = single_flight.do(key, lambda: render(view, kwargs), request.url_rule.rule)
+        return Response(body, status, headers)
+    return wrapper
+
+def rate_limited(view):
+    # 429, если у IP или пользователя Telegram кончились токены (RATE_LIMIT_ENABLED=1)
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        if rate_limiter is not None:
+            ip = rate_limit.client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'))
+            wait = rate_limiter.check(ip, request.headers.get(rate_limit.INIT_DATA_HEADER))
+            if wait:
+                return jsonify({'error': 'Too many requests'}), 429, {'Retry-After': str(math.ceil(wait))}
+        return view(**kwargs)
+    return wrapper
+
+def cached(tags):
+    # Кэширует успешный ответ и отдаёт 304, если у клиента та же версия.
+    # tags(**kwargs) — теги для инвалидации при записи в базу. Промах
+    # вычисляется один раз на все одновременные такие же запросы
+    def decorator(view):
+        def fill(key, kwargs):
+            generation = response_cache.generation
+            with track_timeouts() as missed:
+                body, status, headers = render(view, kwargs)
+            # Фото, не успевшие за бюджет, отданы как null — такой ответ не кэшируем
+            if status != 200 or missed:
+                return body, status, headers, None
+            kept = {h: v for h, v in headers if h in CACHED_HEADERS}
+            return body, status, headers, response_cache.put(key, body, kept, tags(**kwargs), generation)
+
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            key = cache_key(request.path, request.args.items(multi=True))
+            entry = response_cache.get(key)
+            if entry is None:
+                body, status, headers, entry = single_flight.do(key, lambda: fill(key, kwargs), request.url_rule.rule)
+                if entry is None:
+                    return Response(body, status, headers)
+            if request.if_none_match.contains(entry.etag):
+                response = Response(status=304)
+            else:
+                response = Response(entry.body, headers=entry.headers)
+            response.set_etag(entry.etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
+
+def page_args(shape=None):
+    # limit/cursor из запроса; shape — типы полей ключа этого списка.
+    # ValueError — некорректные параметры
+    return parse_limit(request.args.get('limit')), decode_cursor(request.args.get('cursor'), shape)
+
+def paged_response(items, next_key):
+    # Тело — по-прежнему массив, курсор следующей страницы — в заголовке
+    response = jsonify(items)
+    if next_key:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+    return response
+
+# ========== Метрики (METRICS_ENABLED=1) ==========
 
-from database import Database
-db_helper = Database()
+if metrics.ENABLED:
+    @app.before_request
+    def start_request_metrics():
+        g.request_stats = metrics.start_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        stats = g.pop('request_stats', None)
+        if stats is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            response.headers.update(metrics.finish_request(stats, route, request.method, response.status_code))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # ========== Эндпоинты для тренеров ==========
 @app.route('/api/trainer/status', methods=['GET'])
@@ -49,10 +157,7 @@ def trainer_status():
     if status is None:
         return jsonify({'registered': False})
     # Добавляем photo_url
-    if status['photo']:
-        status['photo_url'] = get_telegram_file_url(status['photo'])
-    else:
-        status['photo_url'] = None
+    photo_resolver.attach([status])
     status['registered'] = True
     return jsonify(status)
 
@@ -97,18 +202,8 @@ def trainer_schedule():
         user_id = int(user_id)
     except:
         return jsonify({'error': 'Invalid user_id'}), 400
-    schedule = db_helper.get_trainer_schedule(user_id)
-    days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    result = []
-    for s in schedule:
-        result.append({
-            'id': s[0],
-            'day': s[1],
-            'day_name': days[s[1]-1] if 1 <= s[1] <= 7 else '',
-            'time': s[2],
-            'max_clients': s[3]
-        })
-    return jsonify(result)
+    # Строки — ScheduleSlot из models.py, сериализуются как есть
+    return jsonify(db_helper.get_trainer_schedule(user_id))
 
 @app.route('/api/trainer/schedule', methods=['POST'])
 def trainer_add_slot():
@@ -133,6 +228,29 @@ def trainer_delete_slot(slot_id):
     db_helper.delete_schedule(slot_id)
     return jsonify({'status': 'deleted'})
 
+@app.route('/api/trainer/schedule/bulk', methods=['POST'])
+def trainer_bulk_schedule():
+    # Шаблон недели / правила повторения и удаления одной транзакцией;
+    # mode=replace заменяет всю неделю. Ответ — разница с прежним расписанием
+    data = request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Missing user_id'}), 400
+    try:
+        user_id = int(user_id)
+    except:
+        return jsonify({'error': 'Invalid user_id'}), 400
+    mode = data.get('mode', 'merge')
+    if mode not in ('merge', 'replace'):
+        return jsonify({'error': 'mode must be merge or replace'}), 400
+    try:
+        slots = schedule_templates.expand(data.get('slots'), data.get('rules'))
+        delete_ids, delete_slots = schedule_templates.parse_deletes(data.get('delete'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    diff = db_helper.apply_schedule(user_id, slots, delete_ids, delete_slots, replace=mode == 'replace')
+    return jsonify(diff)
+
 @app.route('/api/trainer/bookings', methods=['GET'])
 def trainer_bookings():
     user_id = request.args.get('user_id')
@@ -143,16 +261,31 @@ def trainer_bookings():
         user_id = int(user_id)
     except:
         return jsonify({'error': 'Invalid user_id'}), 400
-    bookings = db_helper.get_trainer_bookings(user_id, date)
-    result = []
-    for b in bookings:
-        result.append({
-            'id': b[0],
-            'client_name': b[1],
-            'client_phone': b[2],
-            'date': b[3],
-            'time': b[4]
-        })
+    try:
+        limit, after = page_args(BOOKING_CURSOR)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+    bookings, next_key = db_helper.list_trainer_bookings(user_id, date, limit, after)
+    return paged_response(bookings, next_key)
+
+@app.route('/api/trainer/dashboard', methods=['GET'])
+def trainer_dashboard():
+    # Профиль, неделя расписания, записи на days дней и статистика за weeks недель
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Missing user_id'}), 400
+    try:
+        user_id = int(user_id)
+        days = int(request.args.get('days', dashboard.DEFAULT_DAYS))
+        weeks = int(request.args.get('weeks', dashboard.DEFAULT_WEEKS))
+    except:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    if not 1 <= days <= dashboard.MAX_DAYS or not 1 <= weeks <= dashboard.MAX_WEEKS:
+        return jsonify({'error': f'days must be 1-{dashboard.MAX_DAYS}, weeks 1-{dashboard.MAX_WEEKS}'}), 400
+    result = dashboard.build(db_helper, user_id, datetime.now().date(), days, weeks)
+    if result is None:
+        return jsonify({'error': 'Trainer not found'}), 404
+    photo_resolver.attach([result['profile']])
     return jsonify(result)
 
 @app.route('/api/trainer/profile', methods=['PUT'])
@@ -173,57 +306,69 @@ def trainer_update_profile():
 
 # ========== Клиентские эндпоинты (остаются) ==========
 @app.route('/api/trainers', methods=['GET'])
+@rate_limited
+@cached(lambda: [CATALOG])
 def get_trainers():
     search = request.args.get('search', '')
-    trainers = db_helper.get_all_trainers(search if search else None)
-    for t in trainers:
-        if t['photo']:
-            t['photo_url'] = get_telegram_file_url(t['photo'])
-        else:
-            t['photo_url'] = None
-    return jsonify(trainers)
+    offset = request.args.get('offset', type=int)
+    try:
+        limit, after = page_args(ID_CURSOR)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+    if search or offset is not None:
+        # Поиск упорядочен по релевантности — здесь курсор хранит смещение
+        offset = max(after[0] if after else offset or 0, 0)
+        trainers = db_helper.get_all_trainers(search if search else None, limit + 1, offset)
+        next_key = (offset + limit,) if len(trainers) > limit else None
+        trainers = trainers[:limit]
+    else:
+        trainers, next_key = db_helper.list_trainers(limit, after)
+    photo_resolver.attach(trainers)
+    return paged_response(trainers, next_key)
 
 @app.route('/api/trainers/<int:user_id>', methods=['GET'])
+@rate_limited
+@cached(lambda user_id: [trainer_tag(user_id)])
 def get_trainer(user_id):
     trainer = db_helper.get_trainer_by_id(user_id)
     if not trainer:
         return jsonify({'error': 'Trainer not found'}), 404
-    if trainer['photo']:
-        trainer['photo_url'] = get_telegram_file_url(trainer['photo'])
-    else:
-        trainer['photo_url'] = None
+    photo_resolver.attach([trainer])
     return jsonify(trainer)
 
+# Максимальная длина диапазона для /api/availability
+MAX_AVAILABILITY_DAYS = 62
+
 @app.route('/api/schedule/<int:trainer_id>/<date>', methods=['GET'])
+@rate_limited
+@coalesced
 def get_schedule(trainer_id, date):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        date_obj = datetime.strptime(date, '%Y-%m-%d')
-        day_of_week = date_obj.isoweekday()
+        date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except:
+        return jsonify({'error': 'Invalid date'}), 400
+    slots = db_helper.get_availability(trainer_id, date, date)
+    result = [{'id': s['id'], 'time': s['time'], 'free': s['free']} for s in slots if s['free'] > 0]
+    return jsonify(result)
+
+@app.route('/api/availability/<int:trainer_id>', methods=['GET'])
+def get_availability(trainer_id):
+    # Свободные слоты на диапазон дат: {дата: [{id, time, free}, ...]}
+    try:
+        date_from = datetime.strptime(request.args.get('from') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+        date_to = request.args.get('to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else date_from + timedelta(days=6)
     except:
-        conn.close()
         return jsonify({'error': 'Invalid date'}), 400
-    cursor.execute(
-        "SELECT id, time, max_clients FROM schedule WHERE trainer_id = ? AND day_of_week = ?",
-        (trainer_id, day_of_week)
-    )
-    slots = cursor.fetchall()
-    result = []
-    for slot in slots:
-        cursor.execute(
-            "SELECT COUNT(*) FROM bookings WHERE trainer_id = ? AND booking_date = ? AND booking_time = ? AND status='active'",
-            (trainer_id, date, slot['time'])
-        )
-        booked = cursor.fetchone()[0]
-        free = slot['max_clients'] - booked
-        if free > 0:
-            result.append({
-                'id': slot['id'],
-                'time': slot['time'],
-                'free': free
-            })
-    conn.close()
+    if date_to < date_from:
+        return jsonify({'error': 'Invalid date range'}), 400
+    if (date_to - date_from).days >= MAX_AVAILABILITY_DAYS:
+        return jsonify({'error': f'Range is limited to {MAX_AVAILABILITY_DAYS} days'}), 400
+    slots = db_helper.get_availability(trainer_id, date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d'))
+    result = {}
+    for s in slots:
+        if s['free'] > 0:
+            result.setdefault(s['date'], []).append({'id': s['id'], 'time': s['time'], 'free': s['free']})
     return jsonify(result)
 
 @app.route('/api/book', methods=['POST'])
@@ -237,67 +382,46 @@ def book():
     telegram_id = data.get('telegram_id')
     if not all([trainer_id, date, time, client_name, client_phone]):
         return jsonify({'error': 'Missing fields'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        date_obj = datetime.strptime(date, '%Y-%m-%d')
-        day_of_week = date_obj.isoweekday()
+        date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
     except:
-        conn.close()
         return jsonify({'error': 'Invalid date'}), 400
-    cursor.execute(
-        "SELECT max_clients FROM schedule WHERE trainer_id = ? AND day_of_week = ? AND time = ?",
-        (trainer_id, day_of_week, time)
-    )
-    slot = cursor.fetchone()
-    if not slot:
-        conn.close()
+    try:
+        booking_id = db_helper.book_slot(trainer_id, client_name, client_phone, telegram_id, date, time)
+    except SlotNotFound:
         return jsonify({'error': 'Slot not found'}), 404
-    cursor.execute(
-        "SELECT COUNT(*) FROM bookings WHERE trainer_id = ? AND booking_date = ? AND booking_time = ? AND status='active'",
-        (trainer_id, date, time)
-    )
-    booked = cursor.fetchone()[0]
-    if booked >= slot['max_clients']:
-        conn.close()
+    except SlotFull:
         return jsonify({'error': 'No free slots'}), 409
-    cursor.execute(
-        "INSERT INTO bookings (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time) VALUES (?, ?, ?, ?, ?, ?)",
-        (trainer_id, client_name, client_phone, telegram_id, date, time)
-    )
-    conn.commit()
-    booking_id = cursor.lastrowid
-    conn.close()
     return jsonify({'status': 'success', 'booking_id': booking_id})
 
 @app.route('/api/client_bookings/<int:telegram_id>', methods=['GET'])
 def client_bookings(telegram_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT b.id, b.trainer_id, t.name, b.booking_date, b.booking_time, b.status 
-        FROM bookings b 
-        JOIN trainers t ON b.trainer_id = t.user_id 
-        WHERE b.telegram_id = ? 
-        ORDER BY b.booking_date, b.booking_time
-    """, (telegram_id,))
-    bookings = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(b) for b in bookings])
+    # status, from, to — фильтры; since — только изменённые после этой версии
+    try:
+        limit, after = page_args()
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+    try:
+        filters = parse_booking_filters(request.args, BOOKING_STATUSES, after)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    bookings, next_key = db_helper.list_client_bookings(telegram_id, limit, after, *filters)
+    return paged_response(bookings, next_key)
 
 @app.route('/api/cancel_booking/<int:booking_id>', methods=['POST'])
 def cancel_booking(booking_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ?", (booking_id,))
-    conn.commit()
-    conn.close()
+    db_helper.cancel_booking(booking_id)
     return jsonify({'status': 'cancelled'})
 
 @app.route('/api/reviews/<int:trainer_id>', methods=['GET'])
+@cached(lambda trainer_id: [trainer_tag(trainer_id)])
 def get_reviews(trainer_id):
-    reviews = db_helper.get_trainer_reviews(trainer_id)
-    return jsonify(reviews)
+    try:
+        limit, after = page_args(REVIEW_CURSOR)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+    reviews, next_key = db_helper.list_trainer_reviews(trainer_id, limit, after)
+    return paged_response(reviews, next_key)
 
 @app.route('/api/reviews', methods=['POST'])
 def add_review():
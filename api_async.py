@@ -0,0 +1,533 @@
+"""Асинхронный вариант API на aiohttp.
+
+Те же маршруты и JSON-ответы, что и в api.py. Запросы к SQLite уходят в
+пул потоков (у каждого потока своё соединение из ConnectionProvider),
+ссылки на фото разрешаются асинхронно через AsyncPhotoResolver.
+
+    python api_async.py --port 5000
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+import dashboard
+import metrics
+import rate_limit
+import schedule_templates
+import serialization
+from connections import ConnectionProvider
+from database import BOOKING_STATUSES, Database, SlotNotFound, SlotFull
+from pagination import BOOKING_CURSOR, ID_CURSOR, NEXT_CURSOR_HEADER, REVIEW_CURSOR, decode_cursor, encode_cursor, parse_booking_filters, parse_limit
+from response_cache import CACHE_CONTROL, CACHED_HEADERS, CATALOG, ResponseCache, cache_key, trainer_tag
+from single_flight import AsyncSingleFlight
+from telegram_files import AsyncPhotoResolver, track_timeouts
+
+load_dotenv()
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+DATABASE = os.getenv('DATABASE_PATH', 'uniobot.db')
+# Потоков для запросов к SQLite: больше не нужно, запись всё равно одна
+DB_THREADS = int(os.getenv('DB_THREADS', '16'))
+MAX_AVAILABILITY_DAYS = 62
+# Сколько секунд браузер кэширует ответ на preflight, как в api.py
+CORS_MAX_AGE = 86400
+
+routes = web.RouteTableDef()
+
+
+def json_response(data, status=200):
+    return web.Response(body=serialization.dumps_bytes(data), status=status, content_type='application/json',
+                        charset='utf-8')
+
+
+def error(message, status=400):
+    return json_response({'error': message}, status)
+
+
+async def run_db(request, method, *args):
+    # Вызов метода Database в пуле потоков, не блокируя цикл событий;
+    # method — имя метода или функция, получающая базу первым аргументом
+    app = request.app
+    loop = asyncio.get_running_loop()
+    func = getattr(app['db'], method) if isinstance(method, str) else functools.partial(method, app['db'])
+    # run_in_executor не переносит contextvars — без copy_context SQL не попадёт в метрики запроса
+    call = functools.partial(contextvars.copy_context().run, func, *args)
+    return await loop.run_in_executor(app['db_executor'], call)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def page_args(request, shape=None):
+    return parse_limit(request.query.get('limit')), decode_cursor(request.query.get('cursor'), shape)
+
+
+def paged_response(items, next_key):
+    response = json_response(items)
+    if next_key:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+    return response
+
+
+def route_name(request):
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else 'unmatched'
+
+
+async def render(handler, request):
+    # То же, что render() в api.py: ответ как данные для single_flight
+    response = await handler(request)
+    return response.body, response.status, list(response.headers.items())
+
+
+def coalesced(handler):
+    # То же, что coalesced() в api.py
+    @functools.wraps(handler)
+    async def wrapper(request):
+        key = cache_key(request.path, request.query.items())
+        body, status, headers = await request.app['single_flight'].do(
+            key, functools.partial(render, handler, request), route_name(request))
+        return web.Response(body=body, status=status, headers=headers)
+    return wrapper
+
+
+def rate_limited(handler):
+    # То же, что rate_limited() в api.py
+    @functools.wraps(handler)
+    async def wrapper(request):
+        limiter = request.app['rate_limiter']
+        if limiter is not None:
+            ip = rate_limit.client_ip(request.remote, request.headers.get('X-Forwarded-For'))
+            wait = limiter.check(ip, request.headers.get(rate_limit.INIT_DATA_HEADER))
+            if wait:
+                response = error('Too many requests', 429)
+                response.headers['Retry-After'] = str(math.ceil(wait))
+                return response
+        return await handler(request)
+    return wrapper
+
+
+def cached(tags):
+    # То же, что cached() в api.py; tags(match_info) — теги для инвалидации
+    def decorator(handler):
+        async def fill(request, key):
+            cache = request.app['response_cache']
+            generation = cache.generation
+            with track_timeouts() as missed:
+                body, status, headers = await render(handler, request)
+            if status != 200 or missed:
+                return body, status, headers, None
+            kept = {h: v for h, v in headers if h in CACHED_HEADERS}
+            return body, status, headers, cache.put(key, body, kept, tags(request.match_info), generation)
+
+        @functools.wraps(handler)
+        async def wrapper(request):
+            cache = request.app['response_cache']
+            key = cache_key(request.path, request.query.items())
+            entry = cache.get(key)
+            if entry is None:
+                body, status, headers, entry = await request.app['single_flight'].do(
+                    key, functools.partial(fill, request, key), route_name(request))
+                if entry is None:
+                    return web.Response(body=body, status=status, headers=headers)
+            if any(etag.value in (entry.etag, '*') for etag in request.if_none_match or ()):
+                response = web.Response(status=304)
+            else:
+                response = web.Response(body=entry.body, headers=entry.headers)
+            response.headers['ETag'] = f'"{entry.etag}"'
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ========== Эндпоинты для тренеров ==========
+@routes.get('/api/trainer/status')
+async def trainer_status(request):
+    user_id = request.query.get('user_id')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    status = await run_db(request, 'get_trainer_status', user_id)
+    if status is None:
+        return json_response({'registered': False})
+    await request.app['photos'].attach([status])
+    status['registered'] = True
+    return json_response(status)
+
+
+@routes.post('/api/trainer/register')
+async def trainer_register(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    user_id, name, phone = data.get('user_id'), data.get('name'), data.get('phone')
+    if not all([user_id, name, phone]):
+        return error('Missing fields')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    if await run_db(request, 'add_trainer', user_id, name, phone):
+        return json_response({'status': 'registered'})
+    return error('User already registered', 409)
+
+
+@routes.post('/api/trainer/subscribe')
+async def trainer_subscribe(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    user_id = data.get('user_id')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    await run_db(request, 'activate_subscription', user_id, 30)
+    return json_response({'status': 'subscribed', 'days': 30})
+
+
+@routes.get('/api/trainer/schedule')
+async def trainer_schedule(request):
+    user_id = request.query.get('user_id')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    return json_response(await run_db(request, 'get_trainer_schedule', user_id))
+
+
+@routes.post('/api/trainer/schedule')
+async def trainer_add_slot(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    user_id, day, time = data.get('user_id'), data.get('day'), data.get('time')
+    if not all([user_id, day, time]):
+        return error('Missing fields')
+    user_id, day, max_clients = parse_int(user_id), parse_int(day), parse_int(data.get('max_clients', 1))
+    if None in (user_id, day, max_clients):
+        return error('Invalid data')
+    slot_id = await run_db(request, 'add_schedule', user_id, day, time, max_clients)
+    return json_response({'status': 'added', 'id': slot_id})
+
+
+@routes.delete(r'/api/trainer/schedule/{slot_id:\d+}')
+async def trainer_delete_slot(request):
+    await run_db(request, 'delete_schedule', int(request.match_info['slot_id']))
+    return json_response({'status': 'deleted'})
+
+
+@routes.post('/api/trainer/schedule/bulk')
+async def trainer_bulk_schedule(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    if not data.get('user_id'):
+        return error('Missing user_id')
+    user_id = parse_int(data.get('user_id'))
+    if user_id is None:
+        return error('Invalid user_id')
+    mode = data.get('mode', 'merge')
+    if mode not in ('merge', 'replace'):
+        return error('mode must be merge or replace')
+    try:
+        slots = schedule_templates.expand(data.get('slots'), data.get('rules'))
+        delete_ids, delete_slots = schedule_templates.parse_deletes(data.get('delete'))
+    except ValueError as e:
+        return error(str(e))
+    diff = await run_db(request, 'apply_schedule', user_id, slots, delete_ids, delete_slots, mode == 'replace')
+    return json_response(diff)
+
+
+@routes.get('/api/trainer/bookings')
+async def trainer_bookings(request):
+    user_id = request.query.get('user_id')
+    date = request.query.get('date')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    try:
+        limit, after = page_args(request, BOOKING_CURSOR)
+    except ValueError:
+        return error('Invalid pagination parameters')
+    bookings, next_key = await run_db(request, 'list_trainer_bookings', user_id, date, limit, after)
+    return paged_response(bookings, next_key)
+
+
+@routes.get('/api/trainer/dashboard')
+async def trainer_dashboard(request):
+    user_id = request.query.get('user_id')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    days = parse_int(request.query.get('days', dashboard.DEFAULT_DAYS))
+    weeks = parse_int(request.query.get('weeks', dashboard.DEFAULT_WEEKS))
+    if user_id is None or days is None or weeks is None:
+        return error('Invalid parameters')
+    if not 1 <= days <= dashboard.MAX_DAYS or not 1 <= weeks <= dashboard.MAX_WEEKS:
+        return error(f'days must be 1-{dashboard.MAX_DAYS}, weeks 1-{dashboard.MAX_WEEKS}')
+    result = await run_db(request, dashboard.build, user_id, datetime.now().date(), days, weeks)
+    if result is None:
+        return error('Trainer not found', 404)
+    await request.app['photos'].attach([result['profile']])
+    return json_response(result)
+
+
+@routes.put('/api/trainer/profile')
+async def trainer_update_profile(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    user_id = data.get('user_id')
+    if not user_id:
+        return error('Missing user_id')
+    user_id = parse_int(user_id)
+    if user_id is None:
+        return error('Invalid user_id')
+    await run_db(request, 'update_trainer_profile', user_id,
+                 data.get('specialty'), data.get('description'), data.get('photo'))
+    return json_response({'status': 'updated'})
+
+
+# ========== Клиентские эндпоинты ==========
+@routes.get('/api/trainers')
+@rate_limited
+@cached(lambda match_info: [CATALOG])
+async def get_trainers(request):
+    search = request.query.get('search', '')
+    offset = parse_int(request.query.get('offset'))
+    try:
+        limit, after = page_args(request, ID_CURSOR)
+    except ValueError:
+        return error('Invalid pagination parameters')
+    if search or offset is not None:
+        offset = max(after[0] if after else offset or 0, 0)
+        trainers = await run_db(request, 'get_all_trainers', search if search else None, limit + 1, offset)
+        next_key = (offset + limit,) if len(trainers) > limit else None
+        trainers = trainers[:limit]
+    else:
+        trainers, next_key = await run_db(request, 'list_trainers', limit, after)
+    await request.app['photos'].attach(trainers)
+    return paged_response(trainers, next_key)
+
+
+@routes.get(r'/api/trainers/{user_id:\d+}')
+@rate_limited
+@cached(lambda match_info: [trainer_tag(match_info['user_id'])])
+async def get_trainer(request):
+    trainer = await run_db(request, 'get_trainer_by_id', int(request.match_info['user_id']))
+    if not trainer:
+        return error('Trainer not found', 404)
+    await request.app['photos'].attach([trainer])
+    return json_response(trainer)
+
+
+@routes.get(r'/api/schedule/{trainer_id:\d+}/{date}')
+@rate_limited
+@coalesced
+async def get_schedule(request):
+    try:
+        date = datetime.strptime(request.match_info['date'], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return error('Invalid date')
+    slots = await run_db(request, 'get_availability', int(request.match_info['trainer_id']), date, date)
+    return json_response([{'id': s['id'], 'time': s['time'], 'free': s['free']} for s in slots if s['free'] > 0])
+
+
+@routes.get(r'/api/availability/{trainer_id:\d+}')
+async def get_availability(request):
+    try:
+        date_from = datetime.strptime(request.query.get('from') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+        date_to = request.query.get('to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else date_from + timedelta(days=6)
+    except ValueError:
+        return error('Invalid date')
+    if date_to < date_from:
+        return error('Invalid date range')
+    if (date_to - date_from).days >= MAX_AVAILABILITY_DAYS:
+        return error(f'Range is limited to {MAX_AVAILABILITY_DAYS} days')
+    slots = await run_db(request, 'get_availability', int(request.match_info['trainer_id']),
+                         date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d'))
+    result = {}
+    for s in slots:
+        if s['free'] > 0:
+            result.setdefault(s['date'], []).append({'id': s['id'], 'time': s['time'], 'free': s['free']})
+    return json_response(result)
+
+
+@routes.post('/api/book')
+async def book(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    trainer_id, date, time = data.get('trainer_id'), data.get('date'), data.get('time')
+    client_name, client_phone = data.get('client_name'), data.get('client_phone')
+    if not all([trainer_id, date, time, client_name, client_phone]):
+        return error('Missing fields')
+    try:
+        date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return error('Invalid date')
+    try:
+        booking_id = await run_db(request, 'book_slot', trainer_id, client_name, client_phone,
+                                  data.get('telegram_id'), date, time)
+    except SlotNotFound:
+        return error('Slot not found', 404)
+    except SlotFull:
+        return error('No free slots', 409)
+    return json_response({'status': 'success', 'booking_id': booking_id})
+
+
+@routes.get(r'/api/client_bookings/{telegram_id:\d+}')
+async def client_bookings(request):
+    try:
+        limit, after = page_args(request)
+    except ValueError:
+        return error('Invalid pagination parameters')
+    try:
+        filters = parse_booking_filters(request.query, BOOKING_STATUSES, after)
+    except ValueError as e:
+        return error(str(e))
+    bookings, next_key = await run_db(request, 'list_client_bookings', int(request.match_info['telegram_id']),
+                                      limit, after, *filters)
+    return paged_response(bookings, next_key)
+
+
+@routes.post(r'/api/cancel_booking/{booking_id:\d+}')
+async def cancel_booking(request):
+    await run_db(request, 'cancel_booking', int(request.match_info['booking_id']))
+    return json_response({'status': 'cancelled'})
+
+
+@routes.get(r'/api/reviews/{trainer_id:\d+}')
+@cached(lambda match_info: [trainer_tag(match_info['trainer_id'])])
+async def get_reviews(request):
+    try:
+        limit, after = page_args(request, REVIEW_CURSOR)
+    except ValueError:
+        return error('Invalid pagination parameters')
+    reviews, next_key = await run_db(request, 'list_trainer_reviews', int(request.match_info['trainer_id']), limit, after)
+    return paged_response(reviews, next_key)
+
+
+@routes.post('/api/reviews')
+async def add_review(request):
+    data = await read_json(request)
+    if data is None:
+        return error('Invalid JSON')
+    trainer_id, user_id, rating = data.get('trainer_id'), data.get('user_id'), data.get('rating')
+    if not all([trainer_id, user_id, rating]):
+        return error('Missing fields')
+    if rating < 1 or rating > 5:
+        return error('Rating must be 1-5')
+    await run_db(request, 'add_review', trainer_id, user_id, data.get('user_name', 'Аноним'),
+                 rating, data.get('text', ''))
+    return json_response({'status': 'success'})
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # То же, что CORS(app) во Flask-версии: разрешаем любые источники
+    if request.method == 'OPTIONS':
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+        response.headers['Access-Control-Max-Age'] = str(CORS_MAX_AGE)
+    else:
+        try:
+            response = await handler(request)
+        except web.HTTPException as exc:
+            # 404, 405 и прочие ответы-исключения aiohttp тоже с CORS
+            _cors_headers(exc)
+            raise
+    _cors_headers(response)
+    return response
+
+
+def _cors_headers(response):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = f'{NEXT_CURSOR_HEADER}, ETag, Retry-After'
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    # То же, что before/after_request с метриками во Flask-версии
+    stats = metrics.start_request()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        route = route_name(request)
+        headers = metrics.finish_request(stats, route, request.method, status)
+    response.headers.update(headers)
+    return response
+
+
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def create_app(database=DATABASE, bot_token=BOT_TOKEN, db_threads=DB_THREADS, database_url=None):
+    middlewares = [cors_middleware]
+    if metrics.ENABLED:
+        middlewares.append(metrics_middleware)
+    app = web.Application(middlewares=middlewares)
+    database_url = database_url or os.getenv('DATABASE_URL')
+    if database_url:
+        from repository import SqlRepository
+        app['db'] = SqlRepository(database_url, pool_size=db_threads)
+    else:
+        app['db'] = Database(database, ConnectionProvider(database, factory=metrics.connection_factory()))
+    app['db_executor'] = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='db')
+    app['photos'] = AsyncPhotoResolver(bot_token)
+    app['response_cache'] = ResponseCache(ttl=int(os.getenv('RESPONSE_CACHE_TTL', '60')))
+    app['db'].add_listener(app['response_cache'].on_database_change)
+    app['single_flight'] = AsyncSingleFlight()
+    app['rate_limiter'] = rate_limit.from_env(bot_token)
+    app.add_routes(routes)
+    if metrics.ENABLED:
+        app.router.add_get('/metrics', metrics_endpoint)
+
+    async def shutdown(app):
+        await app['photos'].close()
+        app['db_executor'].shutdown(wait=False)
+
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Асинхронный API-сервер UNIO')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
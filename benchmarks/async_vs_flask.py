@@ -0,0 +1,107 @@
+"""Сравнение Flask (gunicorn gthread) и api_async (aiohttp) под одной нагрузкой.
+
+Оба сервера поднимаются одним процессом на одной и той же базе, Telegram
+заменён локальной заглушкой с задержкой. Нагрузка — C одновременных
+клиентов в течение D секунд по каталогу, профилям и расписанию.
+
+    python -m benchmarks.async_vs_flask --concurrency 200 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.common import TelegramStub, start_server, summarize
+from database import Database
+
+
+def seed(path, trainers):
+    db = Database(path)
+    with db.transaction() as conn:
+        for user_id in range(1, trainers + 1):
+            conn.execute(
+                "INSERT INTO trainers (user_id, name, phone, specialty, photo, subscription_end, is_active) "
+                "VALUES (?, ?, '000', 'фитнес', ?, '2099-01-01', 1)",
+                (user_id, f'Тренер {user_id}', f'file-{user_id}')
+            )
+            conn.executemany(
+                "INSERT INTO schedule (trainer_id, day_of_week, time, max_clients) VALUES (?, ?, ?, 3)",
+                [(user_id, day, f'{hour:02d}:00') for day in range(1, 8) for hour in range(9, 19)]
+            )
+
+
+async def load(base_url, paths, concurrency, duration):
+    latencies = []
+    errors = 0
+    counter = itertools.cycle(paths)
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                async with session.get(base_url + next(counter)) as resp:
+                    await resp.read()
+                    if resp.status >= 500:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.monotonic() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.monotonic()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return summarize(latencies, elapsed, errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trainers', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--threads', type=int, default=16, help='потоков gunicorn для Flask')
+    parser.add_argument('--port', type=int, default=5080)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-bench-'), 'uniobot.db')
+    seed(path, args.trainers)
+    paths = ['/api/trainers'] + [
+        p for user_id in range(1, args.trainers + 1)
+        for p in (f'/api/trainers/{user_id}', f'/api/schedule/{user_id}/2024-01-01')
+    ]
+    servers = {
+        'flask': [sys.executable, '-m', 'gunicorn', '-w', '1', '-k', 'gthread', '--threads', str(args.threads),
+                  '-b', f'127.0.0.1:{args.port}', 'api:app'],
+        'async': [sys.executable, 'api_async.py', '--host', '127.0.0.1', '--port', str(args.port)],
+    }
+    results = {}
+    for name, command in servers.items():
+        # Своя заглушка на каждый сервер: кэш фото у обоих начинается пустым
+        with TelegramStub(args.telegram_latency) as stub:
+            env = {'DATABASE_PATH': path, 'TELEGRAM_API_URL': stub.url, 'BOT_TOKEN': 'bench'}
+            proc = start_server(command, env, args.port)
+            try:
+                results[name] = asyncio.run(load(f'http://127.0.0.1:{args.port}', paths,
+                                                 args.concurrency, args.duration))
+                results[name]['telegram_calls'] = stub.calls
+            finally:
+                proc.terminate()
+                proc.wait()
+        print(name, json.dumps(results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    main()
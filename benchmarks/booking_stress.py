@@ -0,0 +1,88 @@
+"""Стресс-проверка атомарной записи на слот.
+
+Несколько процессов одновременно пытаются записаться в один и тот же слот
+через Database.book_slot и отменяют часть записей. В конце проверяется,
+что активных записей не больше max_clients.
+
+    python -m benchmarks.booking_stress --processes 8 --attempts 50 --capacity 3
+
+--repository проверяет то же через SqlRepository (SQLAlchemy) на файле SQLite.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+
+from database import Database, SlotFull
+
+TRAINER_ID = 1
+DATE = '2024-01-01'  # понедельник
+TIME = '10:00'
+
+
+def open_database(path, repository):
+    if repository:
+        from repository import SqlRepository
+        return SqlRepository('sqlite:///' + path)
+    return Database(path)
+
+
+def worker(path, attempts, barrier, seed, repository):
+    db = open_database(path, repository)
+    barrier.wait()
+    booked = full = cancelled = 0
+    for i in range(attempts):
+        try:
+            booking_id = db.book_slot(TRAINER_ID, f'client {seed}-{i}', '000', seed, DATE, TIME)
+        except SlotFull:
+            full += 1
+            continue
+        booked += 1
+        # Каждую вторую успешную запись отменяем, чтобы места освобождались
+        if booked % 2 == 0:
+            db.cancel_booking(booking_id)
+            cancelled += 1
+    return booked, full, cancelled
+
+
+def run(processes, attempts, capacity, repository=False):
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-stress-'), 'uniobot.db')
+    db = open_database(path, repository)
+    db.add_trainer(TRAINER_ID, 'Stress', '000')
+    db.add_schedule(TRAINER_ID, 1, TIME, capacity)
+
+    barrier = multiprocessing.Manager().Barrier(processes)
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(worker, [(path, attempts, barrier, n, repository) for n in range(processes)])
+
+    conn = sqlite3.connect(path)
+    active = conn.execute(
+        "SELECT COUNT(*) FROM bookings WHERE trainer_id = ? AND booking_date = ? AND booking_time = ? AND status = 'active'",
+        (TRAINER_ID, DATE, TIME)
+    ).fetchone()[0]
+    booked = sum(r[0] for r in results)
+    full = sum(r[1] for r in results)
+    cancelled = sum(r[2] for r in results)
+    print(f'attempts: {processes * attempts}, booked: {booked}, cancelled: {cancelled}, '
+          f'rejected: {full}, active now: {active}, capacity: {capacity}')
+    return active <= capacity and active == booked - cancelled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=50)
+    parser.add_argument('--capacity', type=int, default=3)
+    parser.add_argument('--repository', action='store_true', help='SqlRepository вместо Database')
+    args = parser.parse_args(argv)
+    if not run(args.processes, args.attempts, args.capacity, args.repository):
+        print('FAIL: slot capacity exceeded or bookings lost')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
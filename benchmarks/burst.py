@@ -0,0 +1,104 @@
+"""Всплеск одинаковых запросов к одному тренеру: single-flight и лимиты.
+
+Как после поста в канале со ссылкой на популярного тренера: волны по B
+одновременных запросов к /api/trainers/<id> и /api/schedule/<id>/<дата>.
+Кэш ответов выключен (RESPONSE_CACHE_TTL=0), чтобы каждый запрос доходил
+до вычисления. По /metrics считается, сколько запросов реально выполнено
+(leader) и сколько дождалось чужого результата (coalesced), сколько на
+это ушло SQL-выражений и вызовов Bot API; с --rate-limit — сколько
+запросов получили 429.
+
+    python -m benchmarks.burst --burst 100 --waves 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import date, timedelta
+
+import aiohttp
+
+from benchmarks.common import TelegramStub, start_server, summarize
+from benchmarks.generate import generate
+
+
+def scrape(base_url):
+    # Prometheus-текст -> {строка с метками: значение}
+    with urllib.request.urlopen(base_url + '/metrics') as resp:
+        lines = resp.read().decode().splitlines()
+    return {name: float(value) for name, value in (line.rsplit(' ', 1) for line in lines if not line.startswith('#'))}
+
+
+def delta(before, after, prefix, *parts):
+    # Прирост счётчиков с именем prefix и метками, содержащими parts
+    return int(sum(value - before.get(name, 0) for name, value in after.items()
+                   if name.startswith(prefix) and all(part in name for part in parts)))
+
+
+async def waves(base_url, paths, burst, count):
+    latencies = {route: [] for route in paths}
+    statuses = {}
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=burst)) as session:
+        async def one(route):
+            started = time.monotonic()
+            async with session.get(base_url + paths[route]) as resp:
+                await resp.read()
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies[route].append(time.monotonic() - started)
+
+        started = time.monotonic()
+        for _ in range(count):
+            await asyncio.gather(*(one(route) for route in paths for _ in range(burst)))
+        elapsed = time.monotonic() - started
+    return {route: summarize(values, elapsed) for route, values in latencies.items()}, statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--burst', type=int, default=100, help='одновременных запросов на маршрут')
+    parser.add_argument('--waves', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=32, help='потоков gunicorn')
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--rate-limit', action='store_true', help='включить RATE_LIMIT_ENABLED')
+    parser.add_argument('--port', type=int, default=5084)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-burst-'), 'uniobot.db')
+    generate(path, trainers=50, days=14)
+    day = date.today() + timedelta(days=1)
+    paths = {'trainer': '/api/trainers/1', 'schedule': f'/api/schedule/1/{day:%Y-%m-%d}'}
+    command = [sys.executable, '-m', 'gunicorn', '-w', '1', '-k', 'gthread', '--threads', str(args.threads),
+               '-b', f'127.0.0.1:{args.port}', 'api:app']
+    base_url = f'http://127.0.0.1:{args.port}'
+    with TelegramStub(args.telegram_latency) as stub:
+        env = {'DATABASE_PATH': path, 'TELEGRAM_API_URL': stub.url, 'BOT_TOKEN': 'bench', 'METRICS_ENABLED': '1',
+               'RESPONSE_CACHE_TTL': '0', 'RATE_LIMIT_ENABLED': '1' if args.rate_limit else '0'}
+        proc = start_server(command, env, args.port)
+        try:
+            before = scrape(base_url)
+            results, statuses = asyncio.run(waves(base_url, paths, args.burst, args.waves))
+            after = scrape(base_url)
+        finally:
+            proc.terminate()
+            proc.wait()
+    for route, summary in results.items():
+        print(route, json.dumps(summary))
+    print('statuses', json.dumps(statuses, sort_keys=True))
+    print('computed', delta(before, after, 'single_flight_requests_total', 'result="leader"'),
+          'coalesced', delta(before, after, 'single_flight_requests_total', 'result="coalesced"'),
+          'SQL statements', delta(before, after, 'sql_statements_total'),
+          'Bot API calls', delta(before, after, 'telegram_requests_total'),
+          'rate limited', delta(before, after, 'rate_limit_decisions_total', 'result="rejected"'))
+    if any(status >= 500 for status in statuses):
+        print('FAIL: server errors')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Общие помощники бенчмарков: заглушка Bot API, запуск серверов, статистика."""
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import urllib.request
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TelegramStub:
+    """Локальная заглушка Bot API: getFile и sendMessage с заданной задержкой.
+
+    sendMessage с вероятностью failure_rate отвечает 429 или 500, принятые
+    сообщения копятся в messages как (chat_id, text).
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=1):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.messages = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.calls += 1
+                time.sleep(stub.latency)
+                body = json.dumps({'ok': True, 'result': {'file_path': 'photos/file.jpg'}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                fields = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                with stub._lock:
+                    stub.calls += 1
+                    roll = stub._rng.random()
+                time.sleep(stub.latency)
+                if roll < stub.failure_rate / 2:
+                    status, body = 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                         'parameters': {'retry_after': 1}}
+                elif roll < stub.failure_rate:
+                    status, body = 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+                else:
+                    with stub._lock:
+                        stub.messages.append((int(fields['chat_id']), fields.get('text')))
+                        message_id = len(stub.messages)
+                    status, body = 200, {'ok': True, 'result': {
+                        'message_id': message_id, 'date': int(time.time()), 'text': fields.get('text'),
+                        'chat': {'id': int(fields['chat_id']), 'type': 'private'}}}
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def start_server(args, env, port, timeout=30):
+    """Запускает сервер подпроцессом и ждёт, пока он начнёт отвечать."""
+    proc = subprocess.Popen(args, cwd=ROOT, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/trainers/0', timeout=1)
+        except urllib.error.HTTPError:
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(f'server exited with code {proc.returncode}: {args}')
+            time.sleep(0.1)
+        else:
+            return proc
+    proc.kill()
+    raise RuntimeError(f'server did not start in {timeout}s: {args}')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def compare_baseline(results, baseline, tolerance=0.2, slack_ms=0.0, check_rps=True, metric='p95_ms'):
+    """Сравнивает {имя: summarize()} с эталоном, возвращает список регрессий.
+
+    Регрессия — рост задержки metric больше чем на tolerance (и на slack_ms
+    сверх неё, чтобы шум микросекундных замеров не считался регрессией) или
+    такое же падение пропускной способности. Замеры, которых нет в эталоне, не
+    проверяются.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if current[metric] > reference[metric] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{name}: {metric} {current[metric]} > baseline {reference[metric]}")
+        if check_rps and current['rps'] < reference['rps'] / (1 + tolerance):
+            regressions.append(f"{name}: rps {current['rps']} < baseline {reference['rps']}")
+        if current['errors'] > reference['errors']:
+            regressions.append(f"{name}: errors {current['errors']} > baseline {reference['errors']}")
+    return regressions
+
+
+def check_baseline(results, path, tolerance=0.2, update=False, **options):
+    """Записывает эталон (update) или сверяется с ним. Возвращает код выхода."""
+    if update:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'baseline saved to {path}')
+        return 0
+    if not os.path.exists(path):
+        print(f'no baseline at {path}, run with --update-baseline to create it')
+        return 0
+    with open(path) as f:
+        regressions = compare_baseline(results, json.load(f), tolerance, **options)
+    for line in regressions:
+        print('REGRESSION', line)
+    return 1 if regressions else 0
+
+
+def add_baseline_args(parser, default):
+    parser.add_argument('--baseline', default=default, help='файл эталонных результатов')
+    parser.add_argument('--update-baseline', action='store_true', help='сохранить результаты как эталон')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение, доля')
@@ -0,0 +1,145 @@
+"""Микробенчмарки методов Database.
+
+Каждый метод вызывается --iterations раз со случайными, но
+воспроизводимыми аргументами на копии базы (пишущие методы её меняют).
+Без --db база генерируется через benchmarks.generate в уменьшенном
+объёме. Результаты сравниваются с эталоном; при регрессии код выхода 1.
+
+    python -m benchmarks.generate --db /tmp/bench.db
+    python -m benchmarks.db_methods --db /tmp/bench.db --update-baseline
+    python -m benchmarks.db_methods --db /tmp/bench.db
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import add_baseline_args, check_baseline, summarize
+from benchmarks.generate import FUTURE_DAYS, generate
+from database import Database, SlotFull, SlotNotFound
+
+
+def copy_database(src, dst):
+    # backup забирает и содержимое WAL, в отличие от копирования файла
+    source = sqlite3.connect(src)
+    target = sqlite3.connect(dst)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def next_weekday(today, day_of_week):
+    return (today + timedelta(days=(day_of_week - today.isoweekday()) % 7)).strftime('%Y-%m-%d')
+
+
+def cases(db, rng, today):
+    """Имя замера -> функция без аргументов, вызывающая метод Database."""
+    conn = db.conn
+    trainers = [row[0] for row in conn.execute("SELECT user_id FROM trainers")]
+    slots = conn.execute("SELECT trainer_id, day_of_week, time FROM schedule").fetchall()
+    clients = conn.execute("SELECT MAX(telegram_id) FROM bookings").fetchone()[0] or 1
+    # Синхронизация клиента, видевшего почти всю историю изменений
+    synced = max(conn.execute("SELECT COALESCE(MAX(change_seq), 0) FROM bookings").fetchone()[0] - 1000, 0)
+    week = (today + timedelta(days=6)).strftime('%Y-%m-%d')
+    first_day = today.strftime('%Y-%m-%d')
+    # Отмены идут по записям, созданным book_slot в этом же прогоне
+    booked = []
+
+    def trainer():
+        return rng.choice(trainers)
+
+    def book():
+        trainer_id, day_of_week, slot_time = rng.choice(slots)
+        try:
+            booked.append(db.book_slot(trainer_id, 'Bench', '000', rng.randint(1, clients),
+                                       next_weekday(today, day_of_week), slot_time))
+        except (SlotFull, SlotNotFound):
+            pass
+
+    def cancel():
+        if booked:
+            db.cancel_booking(booked.pop())
+
+    def schedule_roundtrip():
+        db.delete_schedule(db.add_schedule(trainer(), rng.randint(1, 7), '23:30', 1))
+
+    return {
+        'get_trainer_status': lambda: db.get_trainer_status(trainer()),
+        'check_subscription': lambda: db.check_subscription(trainer()),
+        'get_trainer_schedule': lambda: db.get_trainer_schedule(trainer()),
+        'get_trainer_by_id': lambda: db.get_trainer_by_id(trainer()),
+        'get_availability_day': lambda: db.get_availability(trainer(), first_day, first_day),
+        'get_availability_week': lambda: db.get_availability(trainer(), first_day, week),
+        'get_trainer_bookings_date': lambda: db.get_trainer_bookings(trainer(), first_day),
+        'list_trainer_bookings': lambda: db.list_trainer_bookings(trainer(), limit=50),
+        'list_client_bookings': lambda: db.list_client_bookings(rng.randint(1, clients), limit=50),
+        'list_client_bookings_since': lambda: db.list_client_bookings(rng.randint(1, clients), limit=50, since=synced),
+        'list_trainers': lambda: db.list_trainers(limit=50),
+        'get_all_trainers_search': lambda: db.get_all_trainers(search='йога', limit=50),
+        'list_trainer_reviews': lambda: db.list_trainer_reviews(trainer(), limit=20),
+        'get_trainer_rating_avg': lambda: db.get_trainer_rating_avg(trainer()),
+        'get_trainer_review_count': lambda: db.get_trainer_review_count(trainer()),
+        'book_slot': book,
+        'cancel_booking': cancel,
+        'add_review': lambda: db.add_review(trainer(), rng.randint(1, clients), 'Bench', rng.randint(1, 5), ''),
+        'update_trainer_profile': lambda: db.update_trainer_profile(trainer(), description='bench'),
+        'activate_subscription': lambda: db.activate_subscription(trainer()),
+        'add_delete_schedule': schedule_roundtrip,
+    }
+
+
+def run(path, iterations, only=None, seed=1):
+    rng = random.Random(seed)
+    db = Database(path)
+    # «Сегодня» берём из данных генератора, а не из часов: аргументы не
+    # зависят от дня запуска
+    last = db.conn.execute("SELECT MAX(booking_date) FROM bookings").fetchone()[0]
+    today = date.fromisoformat(last) - timedelta(days=FUTURE_DAYS) if last else date(2024, 1, 1)
+    results = {}
+    for name, call in cases(db, rng, today).items():
+        if only and name not in only:
+            continue
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - t)
+        results[name] = summarize(latencies, time.perf_counter() - started)
+        print(f"{name:28} p50 {results[name]['p50_ms']:8.3f}ms  p95 {results[name]['p95_ms']:8.3f}ms  "
+              f"p99 {results[name]['p99_ms']:8.3f}ms  {results[name]['rps']:10.1f}/s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='сгенерированная база; по умолчанию создаётся небольшая')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--only', nargs='*', help='запустить только указанные замеры')
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    parser.add_argument('--slack-ms', type=float, default=0.05, help='абсолютный запас к медиане, мс')
+    add_baseline_args(parser, os.path.join('benchmarks', 'baseline_db.json'))
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-bench-'), 'uniobot.db')
+    if args.db:
+        copy_database(args.db, path)
+    else:
+        generate(path, trainers=200, days=60, today=date(2024, 1, 1))
+    results = run(path, args.iterations, args.only)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    # Вызовы длятся микросекунды, а хвосты пишущих методов зависят от
+    # чекпоинтов WAL: сравниваем медиану с запасом на шум
+    return check_baseline(results, args.baseline, args.tolerance, args.update_baseline,
+                          slack_ms=args.slack_ms, check_rps=False, metric='p50_ms')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
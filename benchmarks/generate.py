@@ -0,0 +1,155 @@
+"""Генератор тестовой базы реалистичного объёма.
+
+Тренеры с недельным расписанием, история записей на каждый слот за
+--days дней назад и две недели вперёд (не больше max_clients активных
+записей на слот) и отзывы с денормализованным рейтингом. Генерация
+детерминирована при одном и том же --seed и --today.
+
+    python -m benchmarks.generate --db /tmp/bench.db --trainers 2000 --days 180
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import migrations
+from database import Database
+
+SPECIALTIES = ('фитнес', 'йога', 'пилатес', 'бокс', 'плавание', 'кроссфит', 'стретчинг', 'танцы')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Олег', 'Елена', 'Дмитрий', 'Ольга', 'Сергей', 'Ирина', 'Павел')
+LAST_NAMES = ('Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Морозов', 'Волков')
+HOURS = [f'{hour:02d}:00' for hour in range(7, 22)]
+# Сколько клиентов приходится на одного тренера
+CLIENTS_PER_TRAINER = 20
+FUTURE_DAYS = 14
+BATCH = 10000
+
+
+def trainer_rows(rng, trainers):
+    for user_id in range(1, trainers + 1):
+        specialty = rng.choice(SPECIALTIES)
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        yield (user_id, name, f'+7900{user_id:07d}', specialty, f'{specialty}, стаж {rng.randint(1, 20)} лет',
+               f'file-{user_id}', '2099-01-01', 1 if rng.random() < 0.9 else 0)
+
+
+def trainer_slots(rng, trainers):
+    # {trainer_id: [(day_of_week, time, max_clients), ...]}
+    slots = {}
+    for trainer_id in range(1, trainers + 1):
+        days = rng.sample(range(1, 8), rng.randint(3, 6))
+        hours = rng.sample(HOURS, rng.randint(2, 6))
+        capacity = rng.choice((1, 1, 2, 3, 5, 10))
+        slots[trainer_id] = [(day, hour, capacity) for day in sorted(days) for hour in sorted(hours)]
+    return slots
+
+
+def booking_rows(rng, slots, dates, clients):
+    for trainer_id, trainer_slots_ in slots.items():
+        for day, hour, capacity in trainer_slots_:
+            for booking_date in dates[day]:
+                for _ in range(rng.randint(0, capacity)):
+                    telegram_id = rng.randint(1, clients)
+                    status = 'cancelled' if rng.random() < 0.1 else 'active'
+                    yield (trainer_id, f'Клиент {telegram_id}', '+7000', telegram_id, booking_date, hour, status)
+
+
+def review_rows(rng, trainers, reviews, today, days):
+    for _ in range(reviews):
+        trainer_id = rng.randint(1, trainers)
+        user_id = rng.randint(1, trainers * CLIENTS_PER_TRAINER)
+        created = datetime.combine(today, datetime.min.time()) - timedelta(seconds=rng.randint(0, days * 86400))
+        yield (trainer_id, user_id, f'Клиент {user_id}', rng.choices((1, 2, 3, 4, 5), (1, 1, 2, 4, 8))[0],
+               'Отличная тренировка', created.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def batches(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(path, trainers=2000, days=180, reviews=None, seed=1, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    reviews = trainers * 100 if reviews is None else reviews
+    # Даты истории и ближайших недель по дням недели (1 — понедельник)
+    dates = {day: [] for day in range(1, 8)}
+    for offset in range(-days, FUTURE_DAYS + 1):
+        day = today + timedelta(days=offset)
+        dates[day.isoweekday()].append(day.strftime('%Y-%m-%d'))
+
+    db = Database(path)
+    counts = {}
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO trainers (user_id, name, phone, specialty, description, photo, subscription_end, is_active) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            trainer_rows(rng, trainers)
+        )
+        slots = trainer_slots(rng, trainers)
+        conn.executemany(
+            "INSERT INTO schedule (trainer_id, day_of_week, time, max_clients) VALUES (?, ?, ?, ?)",
+            ((trainer_id, *slot) for trainer_id, items in slots.items() for slot in items)
+        )
+        counts['trainers'] = trainers
+        counts['schedule'] = sum(len(items) for items in slots.values())
+        counts['bookings'] = 0
+        for batch in batches(booking_rows(rng, slots, dates, trainers * CLIENTS_PER_TRAINER)):
+            conn.executemany(
+                "INSERT INTO bookings (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            counts['bookings'] += len(batch)
+        # Имя тренера и номер изменения, которые заполнил бы Database
+        migrations.backfill_booking_changes(conn)
+        for batch in batches(review_rows(rng, trainers, reviews, today, days)):
+            conn.executemany(
+                "INSERT INTO reviews (trainer_id, user_id, user_name, rating, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+        counts['reviews'] = reviews
+        # Отзывы вставлены в обход add_review — пересчитываем рейтинг разом
+        conn.execute('''
+            UPDATE trainers SET
+                rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.trainer_id = trainers.user_id),
+                review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.trainer_id = trainers.user_id)
+        ''')
+        # И дневные итоги для статистики в кабинете тренера (dashboard)
+        migrations.backfill_daily_stats(conn)
+        counts['daily_stats'] = conn.execute("SELECT COUNT(*) FROM trainer_daily_stats").fetchone()[0]
+    # Записи вставлены в обход Database — занятость слотов считаем заново
+    db.rebuild_occupancy()
+    db.conn.execute("ANALYZE")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench.db')
+    parser.add_argument('--trainers', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=180, help='глубина истории записей, дней')
+    parser.add_argument('--reviews', type=int, default=None, help='по умолчанию 100 на тренера')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--today', type=date.fromisoformat, default=None)
+    args = parser.parse_args(argv)
+    if os.path.exists(args.db):
+        print(f'{args.db} already exists, refusing to overwrite')
+        return 1
+    started = time.monotonic()
+    counts = generate(args.db, args.trainers, args.days, args.reviews, args.seed, args.today)
+    print(', '.join(f'{table}: {count}' for table, count in counts.items()),
+          f'({time.monotonic() - started:.1f}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
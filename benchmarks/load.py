@@ -0,0 +1,136 @@
+"""Нагрузочный прогон api.py: каталог, расписание и запись на слот.
+
+Сервер поднимается через gunicorn на копии сгенерированной базы, Telegram
+заменён локальной заглушкой, так что прогон полностью офлайновый. C
+клиентов в течение D секунд выбирают маршрут по весам сценария; отчёт —
+p50/p95/p99 и пропускная способность по каждому маршруту и в целом.
+При регрессии относительно эталона код выхода 1.
+
+    python -m benchmarks.load --db /tmp/bench.db --concurrency 50 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import aiohttp
+
+from benchmarks.common import TelegramStub, add_baseline_args, check_baseline, start_server, summarize
+from benchmarks.db_methods import copy_database, next_weekday
+from benchmarks.generate import generate
+
+# Маршрут -> доля запросов
+SCENARIO = {
+    'trainers': 30,
+    'trainer': 20,
+    'schedule': 30,
+    'book': 20,
+}
+
+
+class Requests:
+    """Случайные запросы по данным базы: (маршрут, метод, путь, тело)."""
+
+    def __init__(self, path, seed=1):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(path)
+        self.trainers = [row[0] for row in conn.execute("SELECT user_id FROM trainers WHERE is_active = 1")]
+        self.slots = conn.execute("SELECT trainer_id, day_of_week, time FROM schedule").fetchall()
+        self.clients = conn.execute("SELECT MAX(telegram_id) FROM bookings").fetchone()[0] or 1
+        conn.close()
+        self.today = date.today()
+        self.routes = list(SCENARIO)
+        self.weights = [SCENARIO[route] for route in self.routes]
+
+    def next(self):
+        route = self.rng.choices(self.routes, self.weights)[0]
+        if route == 'trainers':
+            return route, 'GET', '/api/trainers?limit=50', None
+        if route == 'trainer':
+            return route, 'GET', f'/api/trainers/{self.rng.choice(self.trainers)}', None
+        if route == 'schedule':
+            day = self.today + timedelta(days=self.rng.randint(0, 13))
+            return route, 'GET', f'/api/schedule/{self.rng.choice(self.trainers)}/{day:%Y-%m-%d}', None
+        trainer_id, day_of_week, slot_time = self.rng.choice(self.slots)
+        telegram_id = self.rng.randint(1, self.clients)
+        body = {'trainer_id': trainer_id, 'date': next_weekday(self.today, day_of_week), 'time': slot_time,
+                'client_name': f'Клиент {telegram_id}', 'client_phone': '+7000', 'telegram_id': telegram_id}
+        return route, 'POST', '/api/book', body
+
+
+async def load(base_url, requests, concurrency, duration):
+    latencies = {route: [] for route in SCENARIO}
+    errors = {route: 0 for route in SCENARIO}
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        while time.monotonic() < deadline:
+            route, method, path, body = requests.next()
+            started = time.monotonic()
+            try:
+                async with session.request(method, base_url + path, json=body) as resp:
+                    await resp.read()
+                    # 409 на занятый слот — нормальный ответ, ошибки только 5xx
+                    if resp.status >= 500:
+                        errors[route] += 1
+                        continue
+            except aiohttp.ClientError:
+                errors[route] += 1
+                continue
+            latencies[route].append(time.monotonic() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.monotonic()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    results = {route: summarize(latencies[route], elapsed, errors[route]) for route in SCENARIO}
+    results['total'] = summarize([v for values in latencies.values() for v in values], elapsed,
+                                 sum(errors.values()))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='сгенерированная база; по умолчанию создаётся небольшая')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2, help='воркеров gunicorn')
+    parser.add_argument('--threads', type=int, default=16, help='потоков на воркер')
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=5081)
+    add_baseline_args(parser, os.path.join('benchmarks', 'baseline_load.json'))
+    args = parser.parse_args(argv)
+
+    # Прогон пишет в базу (book), поэтому всегда работаем с копией
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-load-'), 'uniobot.db')
+    if args.db:
+        copy_database(args.db, path)
+    else:
+        generate(path, trainers=200, days=30)
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'gthread',
+               '--threads', str(args.threads), '-b', f'127.0.0.1:{args.port}', 'api:app']
+    with TelegramStub(args.telegram_latency) as stub:
+        env = {'DATABASE_PATH': path, 'TELEGRAM_API_URL': stub.url, 'BOT_TOKEN': 'bench'}
+        proc = start_server(command, env, args.port)
+        try:
+            results = asyncio.run(load(f'http://127.0.0.1:{args.port}', Requests(path),
+                                       args.concurrency, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait()
+        telegram_calls = stub.calls
+    for route, summary in results.items():
+        print(route, json.dumps(summary))
+    print('telegram calls', telegram_calls)
+    return check_baseline(results, args.baseline, args.tolerance, args.update_baseline)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
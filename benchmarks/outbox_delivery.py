@@ -0,0 +1,94 @@
+"""Проверка доставки уведомлений из outbox через локальную заглушку Bot API.
+
+Создаёт записи и отмены через Database, затем OutboxWorker отправляет
+события в заглушку, которая часть запросов отклоняет с 429 и 500.
+Проверяется, что каждое событие поставлено в очередь и доставлено ровно
+один раз, несмотря на повторы после ошибок.
+
+    python -m benchmarks.outbox_delivery --bookings 200 --failure-rate 0.2
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import TelegramStub
+from database import Database
+from notifier import OutboxWorker, RateLimiter, create_bot
+
+TRAINER_ID = 1
+DATE = '2024-01-01'  # понедельник
+
+
+async def deliver(db, stub, per_chat_interval, timeout):
+    bot = create_bot('123456:bench', stub.url)
+    worker = OutboxWorker(db, bot, batch_size=50, poll_interval=0.05, backoff_base=1.2,
+                          limiter=RateLimiter(per_chat_interval, global_rate=500))
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            await worker.run_once()
+            pending = db.conn.execute("SELECT COUNT(*) FROM outbox WHERE status != 'sent'").fetchone()[0]
+            if not pending:
+                return True
+            await asyncio.sleep(0.05)
+        return False
+    finally:
+        worker.close()
+        await bot.session.close()
+
+
+def run(bookings, clients, failure_rate, per_chat_interval, timeout):
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-outbox-'), 'uniobot.db')
+    db = Database(path)
+    db.add_trainer(TRAINER_ID, 'Outbox', '000')
+    for hour in range(bookings // 10 + 1):
+        db.add_schedule(TRAINER_ID, 1, f'{hour % 24:02d}:{hour // 24:02d}', 10)
+    booking_ids = []
+    for n in range(bookings):
+        hour = n // 10
+        booking_ids.append(db.book_slot(TRAINER_ID, f'client {n}', '000', 1000 + n % clients,
+                                        DATE, f'{hour % 24:02d}:{hour // 24:02d}'))
+    for booking_id in booking_ids[::3]:
+        db.cancel_booking(booking_id)
+        # Повторная отмена не ставит событие второй раз
+        db.cancel_booking(booking_id)
+
+    with TelegramStub(latency=0.001, failure_rate=failure_rate) as stub:
+        started = time.monotonic()
+        done = asyncio.run(deliver(db, stub, per_chat_interval, timeout))
+        elapsed = time.monotonic() - started
+
+    conn = sqlite3.connect(path)
+    events = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    failed = conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'failed'").fetchone()[0]
+    expected = 2 * (bookings + len(booking_ids[::3]))
+    per_chat = Counter(chat_id for chat_id, _ in stub.messages)
+    duplicates = len(stub.messages) - len(set(stub.messages))
+    print(f'events: {events} (expected {expected}), delivered: {len(stub.messages)}, '
+          f'api calls: {stub.calls}, failed: {failed}, duplicates: {duplicates}, '
+          f'busiest chat: {max(per_chat.values())} messages, {elapsed:.1f}s')
+    return done and events == expected and len(stub.messages) == expected and duplicates == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    parser.add_argument('--per-chat-interval', type=float, default=0.01)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args(argv)
+    if not run(args.bookings, args.clients, args.failure_rate, args.per_chat_interval, args.timeout):
+        print('FAIL: events lost, duplicated or not delivered in time')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Проверка, что SqlRepository ведёт себя так же, как Database.
+
+Один и тот же сценарий (регистрация, расписание, записи и отмены,
+отзывы, каталог, outbox, архив) выполняется на чистой базе Database
+(SQLite) и на SqlRepository; результаты каждого шага сравниваются.
+По умолчанию SqlRepository работает с отдельным файлом SQLite, --url
+проверяет другую базу, например пустую PostgreSQL:
+
+    python -m benchmarks.repository_contract
+    python -m benchmarks.repository_contract --url postgresql+psycopg2://unio@localhost/unio_contract
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import dashboard
+from database import Database, SlotFull, SlotNotFound
+from repository import SqlRepository
+
+TRAINER_ID = 1001
+OTHER_ID = 1002
+CLIENT_ID = 5001
+MONDAY = '2024-01-01'
+
+
+def outcome(call, *args, **kwargs):
+    # Исключения — тоже часть контракта
+    try:
+        return call(*args, **kwargs)
+    except (SlotFull, SlotNotFound) as exc:
+        return type(exc).__name__
+
+
+def without(items, *keys):
+    # created_at зависит от момента вызова
+    return [{k: v for k, v in item.items() if k not in keys} for item in items]
+
+
+def scenario(db):
+    """Шаги сценария: [(название, результат)]."""
+    steps = []
+
+    def step(name, value):
+        steps.append((name, value))
+
+    events = []
+    db.add_listener(lambda event, trainer_id: events.append((event, trainer_id)))
+    step('add_trainer', db.add_trainer(TRAINER_ID, 'Анна Силова', '+7900'))
+    step('add_trainer duplicate', db.add_trainer(TRAINER_ID, 'Анна Силова', '+7900'))
+    step('add_trainer other', db.add_trainer(OTHER_ID, 'Boris Yoga', '+7901'))
+    step('status inactive', db.get_trainer_status(TRAINER_ID))
+    step('check_subscription inactive', db.check_subscription(TRAINER_ID))
+    db.activate_subscription(TRAINER_ID, 30)
+    db.activate_subscription(OTHER_ID, 30)
+    db.update_trainer_profile(TRAINER_ID, specialty='Пилатес', description='Утренние группы')
+    db.update_trainer_profile(OTHER_ID, specialty='Yoga', photo='file-1')
+    db.update_trainer_profile(OTHER_ID)
+    step('status active', db.get_trainer_status(TRAINER_ID))
+    step('check_subscription active', db.check_subscription(TRAINER_ID))
+    step('get_trainer_by_id', db.get_trainer_by_id(OTHER_ID))
+    step('get_trainer_by_id missing', db.get_trainer_by_id(999))
+
+    first = db.add_schedule(TRAINER_ID, 1, '10:00', 2)
+    db.add_schedule(TRAINER_ID, 1, '09:00', 1)
+    db.add_schedule(TRAINER_ID, 3, '18:00', 3)
+    step('schedule', db.get_trainer_schedule(TRAINER_ID))
+    step('apply_schedule merge', db.apply_schedule(
+        TRAINER_ID, [(1, '10:00', 3), (2, '07:30', 1), (5, '20:00', 4)], delete_slots=[(3, '18:00')]
+    ))
+    step('apply_schedule replace', db.apply_schedule(
+        TRAINER_ID, [(1, '10:00', 2), (1, '09:00', 1), (2, '07:30', 1), (3, '18:00', 2)], replace=True
+    ))
+    db.delete_schedule(first + 100)
+    step('schedule after apply', db.get_trainer_schedule(TRAINER_ID))
+
+    booked = []
+    for n in range(3):
+        booked.append(outcome(db.book_slot, TRAINER_ID, f'Клиент {n}', '+7000', CLIENT_ID + n % 2,
+                              MONDAY, '10:00'))
+    step('book_slot until full', booked)
+    step('book_slot missing slot', outcome(db.book_slot, TRAINER_ID, 'x', '0', CLIENT_ID, MONDAY, '11:00'))
+    step('add_booking', db.add_booking(TRAINER_ID, 'Вручную', '+7002', None, '2024-01-02', '07:30'))
+    step('add_booking old', db.add_booking(TRAINER_ID, 'Давно', '+7003', CLIENT_ID, '2023-06-05', '09:00'))
+    step('availability', db.get_availability(TRAINER_ID, MONDAY, '2024-01-09'))
+    step('availability one day', db.get_availability(TRAINER_ID, MONDAY, MONDAY))
+    synced = max(b.version for b in db.get_client_bookings(CLIENT_ID))
+    step('cancel', db.cancel_booking(booked[0]))
+    step('cancel again', db.cancel_booking(booked[0]))
+    step('cancel missing', db.cancel_booking(99999))
+    step('book_slot after cancel', outcome(db.book_slot, TRAINER_ID, 'Клиент 3', '+7000', CLIENT_ID, MONDAY, '10:00'))
+    step('trainer bookings', db.get_trainer_bookings(TRAINER_ID))
+    step('trainer bookings by date', db.get_trainer_bookings(TRAINER_ID, MONDAY))
+    page, key = db.list_trainer_bookings(TRAINER_ID, limit=2)
+    step('trainer bookings page', (page, key, db.list_trainer_bookings(TRAINER_ID, limit=2, after=key)))
+    step('client bookings', db.get_client_bookings(CLIENT_ID))
+    page, key = db.list_client_bookings(CLIENT_ID, limit=1)
+    step('client bookings page', (page, key, db.list_client_bookings(CLIENT_ID, limit=1, after=key)))
+    step('client bookings filtered', (db.list_client_bookings(CLIENT_ID, status='cancelled'),
+                                      db.list_client_bookings(CLIENT_ID, date_from=MONDAY, date_to=MONDAY)))
+    step('client bookings since', db.list_client_bookings(CLIENT_ID, since=synced))
+    page, key = db.list_client_bookings(CLIENT_ID, limit=1, since=synced)
+    step('client bookings since page', (page, key, db.list_client_bookings(CLIENT_ID, limit=1, after=key, since=synced)))
+    step('verify_occupancy', db.verify_occupancy())
+
+    for n, rating in enumerate((5, 4, 2)):
+        db.add_review(TRAINER_ID, CLIENT_ID + n, f'Отзыв {n}', rating, 'текст')
+    reviews, key = db.list_trainer_reviews(TRAINER_ID, limit=2)
+    more, _ = db.list_trainer_reviews(TRAINER_ID, limit=2, after=key)
+    step('reviews pages', (without(reviews, 'created_at'), without(more, 'created_at')))
+    step('reviews', without(db.get_trainer_reviews(TRAINER_ID), 'created_at'))
+    step('upcoming bookings', db.list_upcoming_bookings(TRAINER_ID, MONDAY, '2024-01-07', limit=2))
+    step('daily stats', db.get_daily_stats(TRAINER_ID, '2000-01-01', '2999-12-31'))
+    step('dashboard', dashboard.build(db, TRAINER_ID, date.fromisoformat(MONDAY), days=7, weeks=4))
+    step('rating', (db.get_trainer_rating_avg(TRAINER_ID), db.get_trainer_review_count(TRAINER_ID),
+                    db.get_trainer_rating_avg(999), db.get_trainer_review_count(999)))
+
+    by_id = lambda trainers: sorted(trainers, key=lambda t: t['user_id'])
+    step('catalog', by_id(db.get_all_trainers()))
+    step('catalog search', by_id(db.get_all_trainers('пилат')))
+    step('catalog search latin', by_id(db.get_all_trainers('yoga')))
+    page, key = db.list_trainers(limit=1)
+    step('list_trainers', (page, key is not None, db.list_trainers(limit=1, after=key)[0]))
+
+    claimed = db.claim_outbox(limit=100, lease=60)
+    step('claim_outbox', [item[1:] for item in claimed])
+    step('claim_outbox leased', db.claim_outbox(limit=100, lease=60))
+    ids = [item[0] for item in claimed]
+    db.complete_outbox(sent=ids[:-2], retry=[(ids[-2], time.time() - 1, 'timeout')], failed=[(ids[-1], 'blocked')])
+    step('claim_outbox retry', [item[1:] for item in db.claim_outbox(limit=100, lease=60)])
+    step('purge_outbox', db.purge_outbox('2000-01-01 00:00:00'))
+
+    step('archive_bookings', db.archive_bookings('2024-01-01', batch_size=1))
+    step('client bookings after archive', db.get_client_bookings(CLIENT_ID))
+    step('deactivate_expired', db.deactivate_expired_trainers('2999-01-01'))
+    step('catalog after expiry', db.get_all_trainers())
+    step('rebuild_occupancy', db.rebuild_occupancy())
+    step('verify after rebuild', db.verify_occupancy())
+    step('listener events', events)
+    return steps
+
+
+def run(url):
+    directory = tempfile.mkdtemp(prefix='unio-contract-')
+    expected = scenario(Database(os.path.join(directory, 'reference.db')))
+    repository = SqlRepository(url or 'sqlite:///' + os.path.join(directory, 'repository.db'))
+    try:
+        actual = scenario(repository)
+    finally:
+        repository.close()
+    mismatches = 0
+    for (name, want), (_, got) in zip(expected, actual):
+        if want != got:
+            mismatches += 1
+            print(f'MISMATCH {name}:\n  Database:      {want!r}\n  SqlRepository: {got!r}')
+    print(f'{repository.dialect}: {len(expected)} steps, {mismatches} mismatches')
+    return mismatches == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='URL пустой базы для SqlRepository (по умолчанию временный файл SQLite)')
+    args = parser.parse_args(argv)
+    if not run(args.url):
+        print('FAIL: SqlRepository differs from Database')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
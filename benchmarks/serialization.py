@@ -0,0 +1,71 @@
+"""Сравнение прежнего и нового пути сериализации больших списков.
+
+Прежний путь: строки-кортежи, словарь на строку в маршруте, json
+стандартного провайдера Flask. Новый: TrainerBooking из row_factory и
+FastJSONProvider (orjson, если установлен). Печатает медиану времени
+на один ответ и размер тела.
+
+    python -m benchmarks.serialization --rows 5000 --repeat 50
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from models import TrainerBooking
+from serialization import FastJSONProvider, orjson
+
+
+def rows(count):
+    return [(n, f'Клиент {n}', f'+7900{n:07d}', f'2024-{n % 12 + 1:02d}-{n % 28 + 1:02d}', f'{n % 24:02d}:00')
+            for n in range(count)]
+
+
+def legacy(provider, data):
+    result = []
+    for b in data:
+        result.append({
+            'id': b[0],
+            'client_name': b[1],
+            'client_phone': b[2],
+            'date': b[3],
+            'time': b[4]
+        })
+    return provider.response(result).get_data()
+
+
+def fast(provider, data):
+    return provider.response([TrainerBooking(*row) for row in data]).get_data()
+
+
+def measure(func, provider, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = func(provider, data)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, len(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(argv)
+    app = Flask(__name__)
+    data = rows(args.rows)
+    with app.app_context():
+        before = measure(legacy, DefaultJSONProvider(app), data, args.repeat)
+        after = measure(fast, FastJSONProvider(app), data, args.repeat)
+    print(f'{args.rows} rows, orjson: {"yes" if orjson else "no"}')
+    print(f'dict + json:            {before[0]:8.2f} ms, {before[1]} bytes')
+    print(f'row model + fast json:  {after[0]:8.2f} ms, {after[1]} bytes')
+    print(f'speedup: {before[0] / after[0]:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Время старта Flask API под gunicorn: до первого ответа каждого воркера.
+
+gunicorn запускается с N воркерами без preload_app и с ним
+(GUNICORN_PRELOAD, см. gunicorn.conf.py), сервер непрерывно опрашивается,
+а по access-логу (pid воркера) отмечается, когда каждый воркер ответил
+впервые. Затем мастер получает TTIN — новый воркер, как при
+автомасштабировании, — и замеряется его время до первого ответа.
+
+    python -m benchmarks.startup --workers 4 --repeat 3
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from benchmarks.common import ROOT
+from benchmarks.generate import generate
+
+
+class Server:
+    """gunicorn подпроцессом; first_seen — pid воркера -> время первого ответа."""
+
+    def __init__(self, command, env):
+        self.first_seen = {}
+        self._changed = threading.Condition()
+        self.started = time.perf_counter()
+        self.proc = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env, 'PYTHONUNBUFFERED': '1'},
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.proc.stdout:
+            pid = line.strip().strip('<>')
+            if pid.isdigit():
+                with self._changed:
+                    self.first_seen.setdefault(int(pid), time.perf_counter())
+                    self._changed.notify_all()
+
+    def wait_workers(self, count, timeout):
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self.first_seen) >= count, timeout)
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+def poll(url, stop):
+    # Запросы без keep-alive: соединения расходятся по всем воркерам
+    while not stop.is_set():
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+        except urllib.error.HTTPError:
+            pass
+        except OSError:
+            time.sleep(0.005)
+
+
+def run(args, path, preload):
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', '4',
+               '-b', f'127.0.0.1:{args.port}', '--access-logfile', '-', '--access-logformat', '%(p)s', 'api:app']
+    env = {'DATABASE_PATH': path, 'BOT_TOKEN': 'bench', 'GUNICORN_PRELOAD': '1' if preload else '0'}
+    stop = threading.Event()
+    server = Server(command, env)
+    pollers = [threading.Thread(target=poll, args=(f'http://127.0.0.1:{args.port}/api/trainers/0', stop))
+               for _ in range(args.workers * 4)]
+    for thread in pollers:
+        thread.start()
+    try:
+        if not server.wait_workers(args.workers, args.timeout):
+            raise RuntimeError(f'only {len(server.first_seen)} of {args.workers} workers answered')
+        workers = sorted((seen - server.started) * 1000 for seen in server.first_seen.values())
+        scaled = time.perf_counter()
+        server.proc.send_signal(signal.SIGTTIN)
+        if not server.wait_workers(args.workers + 1, args.timeout):
+            raise RuntimeError('TTIN worker did not answer')
+        scale = (max(server.first_seen.values()) - scaled) * 1000
+    finally:
+        stop.set()
+        for thread in pollers:
+            thread.join()
+        server.stop()
+    return workers, scale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--port', type=int, default=5083)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='unio-startup-'), 'uniobot.db')
+    generate(path, trainers=50, days=7)
+    try:
+        for preload in (False, True):
+            runs = [run(args, path, preload) for _ in range(args.repeat)]
+            first = statistics.median(workers[0] for workers, _ in runs)
+            last = statistics.median(workers[-1] for workers, _ in runs)
+            scale = statistics.median(scale for _, scale in runs)
+            print(f'preload_app={"on " if preload else "off"}  first worker {first:7.1f} ms  '
+                  f'all {args.workers} workers {last:7.1f} ms  TTIN worker {scale:7.1f} ms')
+            print('  per worker, last run:', ' '.join(f'{ms:.0f}' for ms in runs[-1][0]))
+    except RuntimeError as exc:
+        print('FAIL:', exc)
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+# Сколько ждать освобождения блокировки записи другим процессом, мс
+BUSY_TIMEOUT_MS = 30000
+# Размер кэша подготовленных выражений на соединение
+CACHED_STATEMENTS = 256
+
+
+class ConnectionProvider:
+    """Выдаёт каждому потоку собственное соединение с базой.
+
+    Соединения работают в режиме автокоммита (isolation_level=None):
+    одиночные запросы не держат неявных транзакций, а составные
+    операции явно оборачиваются в transaction(). Перед fork (gunicorn
+    preload_app) соединение потока, который делает fork, закрывается;
+    остальные унаследованные соединения дочерний процесс не использует
+    и не закрывает — он открывает свои.
+    """
+
+    def __init__(self, path, busy_timeout=BUSY_TIMEOUT_MS, synchronous='NORMAL',
+                 cached_statements=CACHED_STATEMENTS, factory=sqlite3.Connection):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        # Класс соединения; metrics.InstrumentedConnection считает SQL
+        self.factory = factory
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._inherited = None
+        _providers.add(self)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=True,
+            cached_statements=self.cached_statements,
+            factory=self.factory
+        )
+        # WAL: читатели не блокируют писателя и наоборот
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        # В WAL режим NORMAL не теряет целостность, только последние коммиты при сбое ОС
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    def connection(self):
+        if self._pid != os.getpid():
+            # close() в дочернем процессе мог бы снять блокировки и удалить WAL,
+            # которые ещё нужны родителю: просто держим ссылки
+            self._inherited = self._local
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def transaction(self, mode='IMMEDIATE'):
+        # IMMEDIATE берёт блокировку записи до первого чтения, поэтому
+        # проверка и запись внутри атомарны даже между процессами
+        conn = self.connection()
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_providers = weakref.WeakSet()
+
+
+def _close_before_fork():
+    # Соединения, открытые при импорте приложения (миграции в мастере
+    # gunicorn), не должны попасть в воркеры
+    for provider in list(_providers):
+        if provider._pid == os.getpid():
+            provider.close()
+
+
+os.register_at_fork(before=_close_before_fork)
@@ -0,0 +1,119 @@
+"""Сводка для кабинета тренера: /api/trainer/dashboard.
+
+Собирает из методов Database (или SqlRepository) профиль, расписание
+ближайшей недели с заполненностью слотов, записи на ближайшие дни и
+статистику по неделям. Статистика читается из trainer_daily_stats —
+дневных итогов, которые обновляются вместе с записью, отменой и
+отзывом, — а не подсчётом по bookings и reviews.
+"""
+from datetime import date, timedelta
+
+# Записи на столько дней вперёд, не больше MAX_DAYS
+DEFAULT_DAYS = 7
+MAX_DAYS = 31
+# Статистика за столько последних недель, не больше MAX_WEEKS
+DEFAULT_WEEKS = 8
+MAX_WEEKS = 26
+# Больше записей в ответ не попадает (upcoming_more = true)
+UPCOMING_LIMIT = 200
+
+
+def ratio(part, total, digits=2):
+    return round(part / total, digits) if total else 0.0
+
+
+def week_schedule(slots, availability):
+    """Слоты на 7 дней вперёд с числом записей и заполненностью.
+
+    slots — ScheduleSlot тренера, availability — результат get_availability
+    за ту же неделю (свободные места по датам).
+    """
+    by_id = {slot.id: slot for slot in slots}
+    result = []
+    booked_total = capacity_total = 0
+    for item in availability:
+        slot = by_id.get(item['id'])
+        if slot is None:
+            continue
+        booked = max(slot.max_clients - item['free'], 0)
+        booked_total += booked
+        capacity_total += slot.max_clients
+        result.append({
+            'id': slot.id,
+            'date': item['date'],
+            'day': slot.day,
+            'day_name': slot.day_name,
+            'time': slot.time,
+            'max_clients': slot.max_clients,
+            'booked': booked,
+            'fill_rate': ratio(booked, slot.max_clients),
+        })
+    return result, ratio(booked_total, capacity_total)
+
+
+def weekly_stats(daily, today, weeks):
+    """Итоги по неделям (7 дней, последняя заканчивается сегодня), от старой к новой.
+
+    daily — строки get_daily_stats: (день, booked, cancelled, reviews, rating_sum).
+    """
+    buckets = []
+    for n in range(weeks - 1, -1, -1):
+        end = today - timedelta(days=7 * n)
+        buckets.append({'start': (end - timedelta(days=6)).isoformat(), 'end': end.isoformat(),
+                        'booked': 0, 'cancelled': 0, 'reviews': 0, 'rating_sum': 0})
+    for day, booked, cancelled, reviews, rating_sum in daily:
+        # Строки уже отобраны по периоду: индекс недели — по расстоянию до today
+        index = weeks - 1 - (today - date.fromisoformat(day)).days // 7
+        if 0 <= index < weeks:
+            bucket = buckets[index]
+            bucket['booked'] += booked
+            bucket['cancelled'] += cancelled
+            bucket['reviews'] += reviews
+            bucket['rating_sum'] += rating_sum
+    for bucket in buckets:
+        bucket['bookings'] = bucket['booked'] - bucket['cancelled']
+        bucket['cancellation_rate'] = ratio(bucket['cancelled'], bucket['booked'])
+        bucket['rating_avg'] = period_rating([bucket])
+    return buckets
+
+
+def period_rating(weeks):
+    reviews = sum(week['reviews'] for week in weeks)
+    return round(sum(week['rating_sum'] for week in weeks) / reviews, 1) if reviews else None
+
+
+def summary(weeks):
+    booked = sum(week['booked'] for week in weeks)
+    cancelled = sum(week['cancelled'] for week in weeks)
+    # Изменение средней оценки во второй половине периода относительно первой
+    before, after = period_rating(weeks[:len(weeks) // 2]), period_rating(weeks[len(weeks) // 2:])
+    return {
+        'bookings_per_week': round((booked - cancelled) / len(weeks), 1),
+        'cancellation_rate': ratio(cancelled, booked),
+        'rating_avg': period_rating(weeks),
+        'rating_trend': [week['rating_avg'] for week in weeks],
+        'rating_change': round(after - before, 1) if before is not None and after is not None else None,
+    }
+
+
+def build(db, user_id, today, days=DEFAULT_DAYS, weeks=DEFAULT_WEEKS):
+    """Сводка для тренера user_id на дату today (date); None — тренер не найден."""
+    profile = db.get_trainer_status(user_id)
+    if profile is None:
+        return None
+    first = today.isoformat()
+    slots = db.get_trainer_schedule(user_id)
+    availability = db.get_availability(user_id, first, (today + timedelta(days=6)).isoformat()) if slots else []
+    schedule, fill_rate = week_schedule(slots, availability)
+    upcoming, next_key = db.list_upcoming_bookings(user_id, first, (today + timedelta(days=days - 1)).isoformat(),
+                                                   UPCOMING_LIMIT)
+    daily = db.get_daily_stats(user_id, (today - timedelta(days=7 * weeks - 1)).isoformat(), first)
+    stats = weekly_stats(daily, today, weeks)
+    return {
+        'profile': profile,
+        'schedule': schedule,
+        'fill_rate': fill_rate,
+        'upcoming': upcoming,
+        'upcoming_more': next_key is not None,
+        'stats': dict(summary(stats), weeks=stats),
+    }
@@ -1,82 +1,73 @@
+import json
+import re
 import sqlite3
+import time
 from datetime import datetime, timedelta
 
+import migrations
+from connections import ConnectionProvider
+from models import ClientBooking, ScheduleSlot, TrainerBooking, row_factory
+
+# Веса bm25 для колонок поиска: имя, специализация, описание
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+BOOKING_STATUSES = ('active', 'cancelled')
+
+
+class SlotNotFound(Exception):
+    pass
+
+
+class SlotFull(Exception):
+    pass
+
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('uniobot.db', check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    def __init__(self, path='uniobot.db', connections=None):
+        self.path = path
+        self.connections = connections or ConnectionProvider(path)
+        self._has_search_index = None
+        self.listeners = []
         self.create_tables()
     
+    def add_listener(self, callback):
+        # callback(event, trainer_id) вызывается после успешной записи;
+        # event: 'trainer', 'review' или 'booking'
+        self.listeners.append(callback)
+    
+    def _notify(self, event, trainer_id):
+        for callback in self.listeners:
+            callback(event, trainer_id)
+    
+    @property
+    def conn(self):
+        # Соединение текущего потока
+        return self.connections.connection()
+    
+    def transaction(self):
+        return self.connections.transaction()
+    
     def create_tables(self):
-        # Таблица тренеров
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trainers (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER UNIQUE,
-                name TEXT,
-                phone TEXT,
-                specialty TEXT,
-                description TEXT,
-                photo TEXT,
-                subscription_end DATE,
-                is_active BOOLEAN DEFAULT 0
-            )
-        ''')
-        # Таблица расписания
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS schedule (
-                id INTEGER PRIMARY KEY,
-                trainer_id INTEGER,
-                day_of_week INTEGER,
-                time TEXT,
-                max_clients INTEGER DEFAULT 1
-            )
-        ''')
-        # Таблица записей клиентов
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY,
-                trainer_id INTEGER,
-                client_name TEXT,
-                client_phone TEXT,
-                telegram_id INTEGER,
-                booking_date DATE,
-                booking_time TEXT,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
-        # Таблица отзывов
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY,
-                trainer_id INTEGER,
-                user_id INTEGER,
-                user_name TEXT,
-                rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-                text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
+        # Схема создаётся и обновляется миграциями (PRAGMA user_version)
+        migrations.migrate(self.conn)
     
     # ----- Тренеры: регистрация и профиль -----
     def add_trainer(self, user_id, name, phone):
         try:
-            self.cursor.execute(
+            self.conn.execute(
                 "INSERT INTO trainers (user_id, name, phone) VALUES (?, ?, ?)",
                 (user_id, name, phone)
             )
-            self.conn.commit()
-            return True
         except sqlite3.IntegrityError:
             return False
+        self._notify('trainer', user_id)
+        return True
     
     def get_trainer_status(self, user_id):
-        self.cursor.execute(
+        cursor = self.conn.execute(
             "SELECT name, phone, specialty, description, photo, subscription_end, is_active FROM trainers WHERE user_id = ?",
             (user_id,)
         )
-        row = self.cursor.fetchone()
+        row = cursor.fetchone()
         if not row:
             return None
         return {
@@ -104,146 +95,576 @@ class Database:
         if not updates:
             return
         params.append(user_id)
-        self.cursor.execute(f"UPDATE trainers SET {', '.join(updates)} WHERE user_id = ?", params)
-        self.conn.commit()
+        self.conn.execute(f"UPDATE trainers SET {', '.join(updates)} WHERE user_id = ?", params)
+        self._notify('trainer', user_id)
     
     def activate_subscription(self, user_id, days=30):
         end_date = datetime.now() + timedelta(days=days)
-        self.cursor.execute(
+        self.conn.execute(
             "UPDATE trainers SET subscription_end = ?, is_active = 1 WHERE user_id = ?",
             (end_date.strftime('%Y-%m-%d'), user_id)
         )
-        self.conn.commit()
+        self._notify('trainer', user_id)
     
     def check_subscription(self, user_id):
-        self.cursor.execute(
-            "SELECT subscription_end FROM trainers WHERE user_id = ?",
-            (user_id,)
+        # Даты в ISO-формате сравниваются как строки — без разбора в Python
+        cursor = self.conn.execute(
+            "SELECT subscription_end >= ? FROM trainers WHERE user_id = ?",
+            (datetime.now().strftime('%Y-%m-%d'), user_id)
         )
-        result = self.cursor.fetchone()
-        if result and result[0]:
-            end_date = datetime.strptime(result[0], '%Y-%m-%d').date()
-            return end_date >= datetime.now().date()
-        return False
+        result = cursor.fetchone()
+        return bool(result and result[0])
+    
+    def deactivate_expired_trainers(self, today=None):
+        # Снимает is_active с тренеров, чья подписка закончилась; возвращает их user_id
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        with self.transaction() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT user_id FROM trainers WHERE is_active = 1 AND subscription_end < ?", (today,)
+            )]
+            conn.executemany("UPDATE trainers SET is_active = 0 WHERE user_id = ?", [(user_id,) for user_id in expired])
+        for user_id in expired:
+            self._notify('trainer', user_id)
+        return expired
     
     # ----- Расписание -----
     def add_schedule(self, trainer_id, day_of_week, time, max_clients=1):
-        self.cursor.execute(
+        cursor = self.conn.execute(
             "INSERT INTO schedule (trainer_id, day_of_week, time, max_clients) VALUES (?, ?, ?, ?)",
             (trainer_id, day_of_week, time, max_clients)
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        return cursor.lastrowid
     
     def get_trainer_schedule(self, trainer_id):
-        self.cursor.execute(
+        cursor = self.conn.execute(
             "SELECT id, day_of_week, time, max_clients FROM schedule WHERE trainer_id = ? ORDER BY day_of_week, time",
             (trainer_id,)
         )
-        return self.cursor.fetchall()
+        cursor.row_factory = row_factory(ScheduleSlot)
+        return cursor.fetchall()
     
     def delete_schedule(self, slot_id):
-        self.cursor.execute("DELETE FROM schedule WHERE id = ?", (slot_id,))
-        self.conn.commit()
+        self.conn.execute("DELETE FROM schedule WHERE id = ?", (slot_id,))
+    
+    def apply_schedule(self, trainer_id, slots=(), delete_ids=(), delete_slots=(), replace=False):
+        """Пакетное изменение недельного расписания в одной транзакции.
+
+        slots — [(день, время, max_clients)]: новые слоты добавляются, у
+        существующих меняется вместимость. Сначала удаляются слоты из
+        delete_ids / delete_slots ((день, время)), при replace — и все, которых
+        нет в slots (вместе с дублями). Возвращает разницу: added, updated,
+        deleted и число unchanged.
+        """
+        desired = {(day, time): max_clients for day, time, max_clients in slots}
+        delete_ids, delete_slots = set(delete_ids), set(delete_slots)
+        with self.transaction() as conn:
+            existing = conn.execute(
+                "SELECT id, day_of_week, time, max_clients FROM schedule WHERE trainer_id = ? ORDER BY id",
+                (trainer_id,)
+            ).fetchall()
+            deleted, added, updated = plan_schedule(existing, desired, delete_ids, delete_slots, replace)
+            conn.executemany("DELETE FROM schedule WHERE id = ?", [(row[0],) for row in deleted])
+            conn.executemany(
+                "INSERT INTO schedule (trainer_id, day_of_week, time, max_clients) VALUES (?, ?, ?, ?)",
+                [(trainer_id, day, time, desired[(day, time)]) for day, time in added]
+            )
+            conn.executemany("UPDATE schedule SET max_clients = ? WHERE id = ?",
+                             [(max_clients, row[0]) for row, max_clients in updated])
+            # id вставленных строк: executemany не возвращает lastrowid по каждой
+            added = set(added)
+            inserted = [row for row in conn.execute(
+                "SELECT id, day_of_week, time, max_clients FROM schedule WHERE trainer_id = ? ORDER BY day_of_week, time",
+                (trainer_id,)
+            ) if (row[1], row[2]) in added]
+        return schedule_diff(inserted, updated, deleted, len(desired) - len(added) - len(updated))
+    
+    def get_availability(self, trainer_id, date_from, date_to):
+        # Свободные места по всем слотам диапазона дат одним запросом:
+        # даты разворачиваются рекурсивным CTE, занятость — чтение slot_occupancy по ключу.
+        # CROSS JOIN фиксирует порядок: слоты тренера по индексу, а не
+        # Bloom-фильтр по всей таблице schedule на каждый запрос
+        cursor = self.conn.execute(
+            """WITH RECURSIVE days(day) AS (
+                   SELECT date(?)
+                   UNION ALL
+                   SELECT date(day, '+1 day') FROM days WHERE day < date(?)
+               )
+               SELECT days.day, s.id, s.time, s.max_clients - COALESCE(o.booked, 0)
+               FROM schedule s
+               CROSS JOIN days
+               LEFT JOIN slot_occupancy o
+                 ON o.trainer_id = s.trainer_id AND o.booking_date = days.day AND o.booking_time = s.time
+               WHERE s.trainer_id = ? AND s.day_of_week = (CAST(strftime('%w', days.day) AS INTEGER) + 6) % 7 + 1
+               ORDER BY days.day, s.time""",
+            (date_from, date_to, trainer_id)
+        )
+        return [{'date': r[0], 'id': r[1], 'time': r[2], 'free': r[3]} for r in cursor.fetchall()]
     
     # ----- Записи клиентов для тренера -----
     def get_trainer_bookings(self, trainer_id, date=None):
+        return self.list_trainer_bookings(trainer_id, date)[0]
+    
+    def list_trainer_bookings(self, trainer_id, date=None, limit=None, after=None):
+        # Страница активных записей в порядке (дата, время, id); after — ключ последней строки
+        query = "SELECT id, client_name, client_phone, booking_date, booking_time FROM bookings WHERE trainer_id = ? AND status = 'active'"
+        params = [trainer_id]
         if date:
-            self.cursor.execute(
-                "SELECT id, client_name, client_phone, booking_date, booking_time FROM bookings WHERE trainer_id = ? AND booking_date = ? AND status = 'active'",
-                (trainer_id, date)
-            )
-        else:
-            self.cursor.execute(
-                "SELECT id, client_name, client_phone, booking_date, booking_time FROM bookings WHERE trainer_id = ? AND status = 'active' ORDER BY booking_date, booking_time",
-                (trainer_id,)
-            )
-        return self.cursor.fetchall()
+            query += " AND booking_date = ?"
+            params.append(date)
+        if after:
+            query += " AND (booking_date, booking_time, id) > (?, ?, ?)"
+            params.extend(after)
+        query += " ORDER BY booking_date, booking_time, id"
+        return self._page(query, params, limit, lambda b: b.key, TrainerBooking)
+    
+    def list_upcoming_bookings(self, trainer_id, date_from, date_to, limit=None):
+        # Активные записи за период [date_from, date_to]; next_key — есть ли ещё
+        query = ("SELECT id, client_name, client_phone, booking_date, booking_time FROM bookings"
+                 " WHERE trainer_id = ? AND status = 'active' AND booking_date BETWEEN ? AND ?"
+                 " ORDER BY booking_date, booking_time, id")
+        return self._page(query, [trainer_id, date_from, date_to], limit, lambda b: b.key, TrainerBooking)
+    
+    def _page(self, query, params, limit, key, model=None):
+        # Берём на одну строку больше: если она есть, есть и следующая страница.
+        # model — класс из models.py, строки создаются им прямо из курсора
+        if limit is not None:
+            query += " LIMIT ?"
+            params = [*params, limit + 1]
+        cursor = self.conn.execute(query, params)
+        if model is not None:
+            cursor.row_factory = row_factory(model)
+        rows = cursor.fetchall()
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            return rows, key(rows[-1])
+        return rows, None
     
     # ----- Клиентская часть (остаётся) -----
-    def get_all_trainers(self, search=None):
-        query = "SELECT user_id, name, specialty, photo FROM trainers WHERE is_active = 1"
+    def get_all_trainers(self, search=None, limit=None, offset=0):
+        # Рейтинг берём из денормализованных колонок — один запрос на весь каталог
+        terms = fts_query(search) if search else None
+        if terms and self.has_search_index():
+            return self.search_trainers(terms, limit, offset)
+        query = "SELECT user_id, name, specialty, photo, rating_sum, review_count FROM trainers WHERE is_active = 1"
         params = []
         if search:
             query += " AND (name LIKE ? OR specialty LIKE ?)"
             params.extend([f'%{search}%', f'%{search}%'])
-        self.cursor.execute(query, params)
-        rows = self.cursor.fetchall()
-        trainers = []
-        for row in rows:
-            trainers.append({
-                'user_id': row[0],
-                'name': row[1],
-                'specialty': row[2],
-                'photo': row[3],
-                'rating_avg': self.get_trainer_rating_avg(row[0]),
-                'review_count': self.get_trainer_review_count(row[0])
-            })
-        return trainers
+        # Порядок нужен для LIMIT/OFFSET, как в SqlRepository.get_all_trainers
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        cursor = self.conn.execute(query, params)
+        return [catalog_row(row) for row in cursor.fetchall()]
+    
+    def list_trainers(self, limit=None, after=None):
+        # Каталог без поиска: keyset-пагинация по id
+        query = "SELECT user_id, name, specialty, photo, rating_sum, review_count, id FROM trainers WHERE is_active = 1"
+        params = []
+        if after:
+            query += " AND id > ?"
+            params.append(after[0])
+        query += " ORDER BY id"
+        rows, next_key = self._page(query, params, limit, lambda r: (r[6],))
+        return [catalog_row(row) for row in rows], next_key
+    
+    def has_search_index(self):
+        if self._has_search_index is None:
+            cursor = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'trainers_fts'")
+            self._has_search_index = cursor.fetchone() is not None
+        return self._has_search_index
+    
+    def search_trainers(self, terms, limit=None, offset=0):
+        # FTS5: префиксный поиск по имени, специализации и описанию.
+        # bm25 отрицателен (меньше — лучше), высокий рейтинг усиливает совпадение
+        cursor = self.conn.execute(
+            """SELECT t.user_id, t.name, t.specialty, t.photo, t.rating_sum, t.review_count
+               FROM trainers_fts f
+               JOIN trainers t ON t.id = f.rowid
+               WHERE trainers_fts MATCH ? AND t.is_active = 1
+               ORDER BY bm25(trainers_fts, ?, ?, ?)
+                        * (1.0 + CASE WHEN t.review_count > 0 THEN t.rating_sum * 1.0 / t.review_count ELSE 0 END / 10.0),
+                        t.id
+               LIMIT ? OFFSET ?""",
+            (terms, *SEARCH_WEIGHTS, -1 if limit is None else limit, offset)
+        )
+        return [catalog_row(row) for row in cursor.fetchall()]
     
     def get_trainer_by_id(self, user_id):
-        self.cursor.execute(
-            "SELECT name, specialty, description, photo FROM trainers WHERE user_id = ? AND is_active = 1",
+        cursor = self.conn.execute(
+            "SELECT name, specialty, description, photo, rating_sum, review_count FROM trainers WHERE user_id = ? AND is_active = 1",
             (user_id,)
         )
-        row = self.cursor.fetchone()
+        row = cursor.fetchone()
         if not row:
             return None
         return {
+            'user_id': user_id,
             'name': row[0],
             'specialty': row[1],
             'description': row[2],
             'photo': row[3],
-            'rating_avg': self.get_trainer_rating_avg(user_id),
-            'review_count': self.get_trainer_review_count(user_id)
+            'rating_avg': rating_avg(row[4], row[5]),
+            'review_count': row[5]
         }
     
-    def add_booking(self, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time):
-        self.cursor.execute(
-            "INSERT INTO bookings (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time) VALUES (?, ?, ?, ?, ?, ?)",
-            (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time)
+    def _next_change(self, conn):
+        # Номер изменения записи из общего счётчика. Счётчик обновляется в
+        # транзакции записи, поэтому номера видны клиентам в порядке коммитов
+        return conn.execute(
+            "INSERT INTO change_sequence (name, value) VALUES ('bookings', 1) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + 1 RETURNING value"
+        ).fetchone()[0]
+    
+    def _insert_booking(self, conn, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time):
+        # Имя тренера копируется в запись: список записей клиента читается без JOIN
+        change_seq = self._next_change(conn)
+        cursor = conn.execute(
+            "INSERT INTO bookings (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time,"
+            " trainer_name, change_seq) VALUES (?, ?, ?, ?, ?, ?, (SELECT name FROM trainers WHERE user_id = ?), ?)",
+            (trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time,
+             trainer_id, change_seq)
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self._occupy(conn, trainer_id, booking_date, booking_time, 1)
+        self._count_daily(conn, trainer_id, booking_date, booked=1)
+        self._enqueue(conn, 'booked', change_seq, cursor.lastrowid, trainer_id, client_name, client_phone,
+                      telegram_id, booking_date, booking_time)
+        return cursor.lastrowid
+    
+    def add_booking(self, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time):
+        with self.transaction() as conn:
+            booking_id = self._insert_booking(conn, trainer_id, client_name, client_phone,
+                                              telegram_id, booking_date, booking_time)
+        self._notify('booking', trainer_id)
+        return booking_id
     
     def get_client_bookings(self, telegram_id):
-        self.cursor.execute(
-            """SELECT b.id, b.trainer_id, t.name, b.booking_date, b.booking_time, b.status 
-               FROM bookings b 
-               JOIN trainers t ON b.trainer_id = t.user_id 
-               WHERE b.telegram_id = ? 
-               ORDER BY b.booking_date, b.booking_time""",
-            (telegram_id,)
-        )
-        return self.cursor.fetchall()
+        return self.list_client_bookings(telegram_id)[0]
+    
+    def list_client_bookings(self, telegram_id, limit=None, after=None, status=None, date_from=None, date_to=None,
+                             since=None):
+        """Записи клиента по дате и времени; status и даты записи — фильтры.
+
+        since — версия, которую клиент уже видел: тогда возвращаются только
+        записи, изменённые после неё (в том числе отменённые), в порядке
+        version, а ключ страницы — (version,).
+        """
+        query = ("SELECT id, trainer_id, trainer_name, booking_date, booking_time, status, change_seq"
+                 " FROM bookings WHERE telegram_id = ?")
+        params = [telegram_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if date_from:
+            query += " AND booking_date >= ?"
+            params.append(date_from)
+        if date_to:
+            query += " AND booking_date <= ?"
+            params.append(date_to)
+        if since is not None:
+            query += " AND change_seq > ? ORDER BY change_seq"
+            params.append(max(since, after[0]) if after else since)
+            return self._page(query, params, limit, lambda b: (b.version,), ClientBooking)
+        if after:
+            query += " AND (booking_date, booking_time, id) > (?, ?, ?)"
+            params.extend(after)
+        query += " ORDER BY booking_date, booking_time, id"
+        return self._page(query, params, limit, lambda b: b.key, ClientBooking)
+    
+    def book_slot(self, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time):
+        # Проверка вместимости и вставка в одной транзакции — без овербукинга
+        day_of_week = datetime.strptime(booking_date, '%Y-%m-%d').isoweekday()
+        with self.transaction() as conn:
+            slot = conn.execute(
+                "SELECT max_clients FROM schedule WHERE trainer_id = ? AND day_of_week = ? AND time = ?",
+                (trainer_id, day_of_week, booking_time)
+            ).fetchone()
+            if not slot:
+                raise SlotNotFound()
+            booked = conn.execute(
+                "SELECT booked FROM slot_occupancy WHERE trainer_id = ? AND booking_date = ? AND booking_time = ?",
+                (trainer_id, booking_date, booking_time)
+            ).fetchone()
+            if booked and booked[0] >= slot[0]:
+                raise SlotFull()
+            booking_id = self._insert_booking(conn, trainer_id, client_name, client_phone,
+                                              telegram_id, booking_date, booking_time)
+        self._notify('booking', trainer_id)
+        return booking_id
     
     def cancel_booking(self, booking_id):
-        self.cursor.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ?", (booking_id,))
-        self.conn.commit()
-        self.cursor.execute("SELECT trainer_id FROM bookings WHERE id = ?", (booking_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else None
+        # Отменяется только активная запись, повторная отмена ничего не меняет
+        with self.transaction() as conn:
+            result = conn.execute(
+                "SELECT trainer_id, booking_date, booking_time, status, client_name, client_phone, telegram_id "
+                "FROM bookings WHERE id = ?", (booking_id,)
+            ).fetchone()
+            if result and result[3] == 'active':
+                change_seq = self._next_change(conn)
+                conn.execute("UPDATE bookings SET status = 'cancelled', change_seq = ? WHERE id = ?",
+                             (change_seq, booking_id))
+                self._occupy(conn, result[0], result[1], result[2], -1)
+                self._count_daily(conn, result[0], result[1], cancelled=1)
+                self._enqueue(conn, 'cancelled', change_seq, booking_id, result[0], result[4], result[5],
+                              result[6], result[1], result[2])
+        if not result:
+            return None
+        self._notify('booking', result[0])
+        return result[0]
     
-    def add_review(self, trainer_id, user_id, user_name, rating, text):
-        self.cursor.execute(
-            "INSERT INTO reviews (trainer_id, user_id, user_name, rating, text) VALUES (?, ?, ?, ?, ?)",
-            (trainer_id, user_id, user_name, rating, text)
+    def archive_bookings(self, before, batch_size=1000):
+        """Переносит записи с датой раньше before в bookings_archive.
+
+        Каждая пачка — отдельная короткая транзакция, чтобы не держать
+        блокировку записи. Занятость перенесённых слотов тоже удаляется
+        (между пачками у слота, записи которого попали в разные пачки, она
+        ненадолго расходится с bookings). id записей не повторяются
+        (AUTOINCREMENT, m010), поэтому совпадение id с архивом — ошибка, а не
+        перезапись. Возвращает число перенесённых записей.
+        """
+        moved = 0
+        while True:
+            with self.transaction() as conn:
+                batch = conn.execute(
+                    "SELECT id, trainer_id, booking_date, booking_time FROM bookings WHERE booking_date < ? ORDER BY booking_date LIMIT ?",
+                    (before, batch_size)
+                ).fetchall()
+                ids = [(row[0],) for row in batch]
+                conn.executemany(
+                    """INSERT INTO bookings_archive
+                           (id, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time, status,
+                            trainer_name, change_seq)
+                       SELECT id, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time, status,
+                              trainer_name, change_seq
+                       FROM bookings WHERE id = ?""",
+                    ids
+                )
+                conn.executemany("DELETE FROM bookings WHERE id = ?", ids)
+                conn.executemany(
+                    "DELETE FROM slot_occupancy WHERE trainer_id = ? AND booking_date = ? AND booking_time = ?",
+                    {row[1:] for row in batch}
+                )
+            moved += len(batch)
+            if len(batch) < batch_size:
+                return moved
+    
+    # ----- Исходящие уведомления (outbox) -----
+    def _enqueue(self, conn, event, change_seq, booking_id, trainer_id, client_name, client_phone,
+                 telegram_id, booking_date, booking_time):
+        # Вызывается внутри транзакции записи/отмены: событие фиксируется
+        # вместе с ней, а отправка в Telegram не задерживает запрос. Ключ
+        # строится из номера изменения записи — он, в отличие от id, никогда
+        # не повторяется
+        booking = {'booking_id': booking_id, 'trainer_id': trainer_id, 'client_name': client_name,
+                   'client_phone': client_phone, 'date': booking_date, 'time': booking_time}
+        recipients = [('trainer', trainer_id)]
+        if telegram_id:
+            recipients.append(('client', telegram_id))
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, event, chat_id, payload) VALUES (?, ?, ?, ?)",
+            [(f'{event}:{change_seq}:{role}', event, chat_id, json.dumps(dict(booking, role=role), ensure_ascii=False))
+             for role, chat_id in recipients]
         )
-        self.conn.commit()
     
-    def get_trainer_reviews(self, trainer_id):
-        self.cursor.execute(
-            "SELECT user_name, rating, text, created_at FROM reviews WHERE trainer_id = ? ORDER BY created_at DESC",
-            (trainer_id,)
+    def claim_outbox(self, limit=50, lease=60):
+        """Забирает готовые к отправке события: [(id, ключ, event, chat_id, payload, attempts)].
+
+        Забранные строки помечаются 'sending' на lease секунд — другие
+        воркеры их не возьмут; если воркер упал, не отчитавшись, после
+        истечения аренды событие отправится снова.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            rows = conn.execute(
+                """SELECT id, idempotency_key, event, chat_id, payload, attempts FROM outbox
+                   WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? ORDER BY id LIMIT ?""",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(now + lease, row[0]) for row in rows]
+            )
+        return [(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5] + 1) for row in rows]
+    
+    def complete_outbox(self, sent=(), retry=(), failed=()):
+        """Итоги отправки одной транзакцией: sent — [id], retry — [(id, когда, ошибка)],
+        failed — [(id, ошибка)] без повторов."""
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+                [(outbox_id,) for outbox_id in sent]
+            )
+            conn.executemany(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                [(next_attempt_at, error, outbox_id) for outbox_id, next_attempt_at, error in retry]
+            )
+            conn.executemany(
+                "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                [(error, outbox_id) for outbox_id, error in failed]
+            )
+    
+    def purge_outbox(self, before):
+        # Удаляет отправленные события, созданные раньше before
+        with self.transaction() as conn:
+            cursor = conn.execute("DELETE FROM outbox WHERE status = 'sent' AND created_at < ?", (before,))
+        return cursor.rowcount
+    
+    # ----- Занятость слотов -----
+    def _occupy(self, conn, trainer_id, booking_date, booking_time, delta):
+        # Вызывается внутри транзакции записи/отмены, вместе с изменением bookings
+        conn.execute(
+            """INSERT INTO slot_occupancy (trainer_id, booking_date, booking_time, booked) VALUES (?, ?, ?, MAX(?, 0))
+               ON CONFLICT (trainer_id, booking_date, booking_time) DO UPDATE SET booked = MAX(booked + ?, 0)""",
+            (trainer_id, booking_date, booking_time, delta, delta)
+        )
+    
+    # ----- Дневная статистика тренера -----
+    def _count_daily(self, conn, trainer_id, day, booked=0, cancelled=0, reviews=0, rating_sum=0):
+        # Вызывается в транзакции записи, отмены или отзыва
+        conn.execute(
+            """INSERT INTO trainer_daily_stats (trainer_id, day, booked, cancelled, reviews, rating_sum)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (trainer_id, day) DO UPDATE SET
+                   booked = booked + excluded.booked, cancelled = cancelled + excluded.cancelled,
+                   reviews = reviews + excluded.reviews, rating_sum = rating_sum + excluded.rating_sum""",
+            (trainer_id, day, booked, cancelled, reviews, rating_sum)
         )
-        rows = self.cursor.fetchall()
-        return [{'user_name': r[0], 'rating': r[1], 'text': r[2], 'created_at': r[3]} for r in rows]
+    
+    def get_daily_stats(self, trainer_id, date_from, date_to):
+        """Дневные итоги за период: [(день, booked, cancelled, reviews, rating_sum)],
+        только дни, в которые что-то было."""
+        cursor = self.conn.execute(
+            "SELECT day, booked, cancelled, reviews, rating_sum FROM trainer_daily_stats"
+            " WHERE trainer_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (trainer_id, date_from, date_to)
+        )
+        return cursor.fetchall()
+    
+    def verify_occupancy(self):
+        """Расхождения slot_occupancy с bookings:
+        [(trainer_id, дата, время, в таблице, фактически)]."""
+        cursor = self.conn.execute(
+            """WITH actual AS (""" + migrations.SLOT_OCCUPANCY_FROM_BOOKINGS + """)
+               SELECT a.trainer_id, a.booking_date, a.booking_time, COALESCE(o.booked, 0), a.booked
+               FROM actual a
+               LEFT JOIN slot_occupancy o
+                 ON o.trainer_id = a.trainer_id AND o.booking_date = a.booking_date AND o.booking_time = a.booking_time
+               WHERE COALESCE(o.booked, 0) != a.booked
+               UNION ALL
+               SELECT o.trainer_id, o.booking_date, o.booking_time, o.booked, 0
+               FROM slot_occupancy o
+               WHERE o.booked != 0 AND NOT EXISTS (
+                   SELECT 1 FROM bookings b
+                   WHERE b.trainer_id = o.trainer_id AND b.booking_date = o.booking_date
+                     AND b.booking_time = o.booking_time AND b.status = 'active'
+               )
+               ORDER BY 1, 2, 3"""
+        )
+        return cursor.fetchall()
+    
+    def rebuild_occupancy(self):
+        # Пересчёт с нуля, например после записи в bookings в обход Database
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM slot_occupancy")
+            cursor = conn.execute(
+                "INSERT INTO slot_occupancy (trainer_id, booking_date, booking_time, booked) "
+                + migrations.SLOT_OCCUPANCY_FROM_BOOKINGS
+            )
+        return cursor.rowcount
+    
+    def add_review(self, trainer_id, user_id, user_name, rating, text):
+        # Отзыв и счётчики тренера меняются в одной транзакции
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO reviews (trainer_id, user_id, user_name, rating, text) VALUES (?, ?, ?, ?, ?)",
+                (trainer_id, user_id, user_name, rating, text)
+            )
+            conn.execute(
+                "UPDATE trainers SET rating_sum = rating_sum + ?, review_count = review_count + 1 WHERE user_id = ?",
+                (rating, trainer_id)
+            )
+            # День отзыва — как date(created_at), то есть по UTC
+            self._count_daily(conn, trainer_id, datetime.utcnow().strftime('%Y-%m-%d'), reviews=1, rating_sum=rating)
+        self._notify('review', trainer_id)
+    
+    def get_trainer_reviews(self, trainer_id):
+        return self.list_trainer_reviews(trainer_id)[0]
+    
+    def list_trainer_reviews(self, trainer_id, limit=None, after=None):
+        # Новые сверху; (created_at, id) делает порядок стабильным при равном времени
+        query = "SELECT user_name, rating, text, created_at, id FROM reviews WHERE trainer_id = ?"
+        params = [trainer_id]
+        if after:
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY created_at DESC, id DESC"
+        rows, next_key = self._page(query, params, limit, lambda r: (r[3], r[4]))
+        return [{'user_name': r[0], 'rating': r[1], 'text': r[2], 'created_at': r[3]} for r in rows], next_key
     
     def get_trainer_rating_avg(self, trainer_id):
-        self.cursor.execute("SELECT AVG(rating) FROM reviews WHERE trainer_id = ?", (trainer_id,))
-        result = self.cursor.fetchone()[0]
-        return round(result, 1) if result else 0.0
+        cursor = self.conn.execute("SELECT rating_sum, review_count FROM trainers WHERE user_id = ?", (trainer_id,))
+        row = cursor.fetchone()
+        return rating_avg(row[0], row[1]) if row else 0.0
     
     def get_trainer_review_count(self, trainer_id):
-        self.cursor.execute("SELECT COUNT(*) FROM reviews WHERE trainer_id = ?", (trainer_id,))
-        return self.cursor.fetchone()[0]
\ No newline at end of file
+        cursor = self.conn.execute("SELECT review_count FROM trainers WHERE user_id = ?", (trainer_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+
+def rating_avg(rating_sum, review_count):
+    return round(rating_sum / review_count, 1) if review_count else 0.0
+
+
+def schedule_row(row):
+    # (id, day_of_week, time, max_clients) -> словарь для API
+    return {'id': row[0], 'day': row[1], 'time': row[2], 'max_clients': row[3]}
+
+
+def plan_schedule(existing, desired, delete_ids, delete_slots, replace):
+    """Разница между слотами тренера и желаемыми для apply_schedule.
+
+    existing — строки (id, день, время, max_clients) в порядке id, desired —
+    {(день, время): max_clients}. Возвращает (deleted — строки на удаление,
+    added — ключи новых слотов, updated — [(строка, новая вместимость)]).
+    """
+    kept, deleted = {}, []
+    for row in existing:
+        key = (row[1], row[2])
+        if (row[0] in delete_ids or key in delete_slots
+                or replace and (key not in desired or key in kept)):
+            deleted.append(row)
+        elif key not in kept:
+            kept[key] = row
+    added = [key for key in desired if key not in kept]
+    updated = [(kept[key], max_clients) for key, max_clients in desired.items()
+               if key in kept and kept[key][3] != max_clients]
+    return deleted, added, updated
+
+
+def schedule_diff(inserted, updated, deleted, unchanged):
+    return {
+        'added': [schedule_row(row) for row in inserted],
+        'updated': [dict(schedule_row(row), max_clients=max_clients, previous_max_clients=row[3])
+                    for row, max_clients in updated],
+        'deleted': [schedule_row(row) for row in deleted],
+        'unchanged': unchanged,
+    }
+
+
+def catalog_row(row):
+    return {
+        'user_id': row[0],
+        'name': row[1],
+        'specialty': row[2],
+        'photo': row[3],
+        'rating_avg': rating_avg(row[4], row[5]),
+        'review_count': row[5]
+    }
+
+
+def fts_query(search):
+    # Каждое слово запроса — префикс в кавычках, слова объединяются через AND
+    words = re.findall(r'\w+', search.lower())
+    return ' '.join(f'"{word}"*' for word in words) or None
@@ -0,0 +1,23 @@
+"""Настройки gunicorn по умолчанию (читаются из текущего каталога).
+
+GUNICORN_PRELOAD=1 включает preload_app: api импортируется и проверяет
+схему один раз в мастере, а воркеры (в том числе новые — после
+перезапуска или TTIN) получают готовое приложение через fork. Соединения
+SQLite и пул SQLAlchemy мастер закрывает перед fork, Telegram-клиент
+создаётся в воркере при первом запросе. По умолчанию выключено: с
+preload kill -HUP перезапускает воркеры из образа мастера и новый код
+не подхватывает — выкладка требует USR2 (новый мастер) или полного
+перезапуска. С JOBS_IN_PROCESS=1 задачи при preload работают только в
+мастере.
+С METRICS_DIR мастер при старте очищает каталог файлов метрик воркеров.
+"""
+import os
+
+import metrics
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+
+def on_starting(server):
+    # Файлы воркеров прошлого запуска, иначе счётчики начнутся не с нуля
+    metrics.clear_directory()
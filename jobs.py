@@ -0,0 +1,114 @@
+"""Периодические фоновые задачи обслуживания базы.
+
+- deactivate_expired: снимает is_active с тренеров с истёкшей подпиской,
+  чтобы каталог не показывал их без проверки по каждому пользователю;
+- archive_bookings: переносит записи старше ARCHIVE_AFTER_DAYS дней из
+  горячей bookings в bookings_archive пачками по ARCHIVE_BATCH;
+- purge_outbox: удаляет отправленные уведомления старше OUTBOX_KEEP_DAYS.
+
+Запускаются отдельным процессом (python manage.py jobs) или в процессе
+API при JOBS_IN_PROCESS=1 — только для однопроцессного запуска: под
+gunicorn задачи выполнял бы каждый воркер. Число обработанных строк,
+запуски и время попадают в metrics (job_*).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import metrics
+
+# Периодичность задач, секунды
+DEACTIVATE_INTERVAL = int(os.getenv('JOB_DEACTIVATE_INTERVAL', '3600'))
+ARCHIVE_INTERVAL = int(os.getenv('JOB_ARCHIVE_INTERVAL', '86400'))
+# Записи старше стольких дней уходят в архив
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', '1000'))
+OUTBOX_KEEP_DAYS = int(os.getenv('OUTBOX_KEEP_DAYS', '7'))
+
+logger = logging.getLogger(__name__)
+
+
+def deactivate_expired(db):
+    return len(db.deactivate_expired_trainers())
+
+
+def archive_bookings(db):
+    before = (datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d')
+    return db.archive_bookings(before, ARCHIVE_BATCH)
+
+
+def purge_outbox(db):
+    # created_at заполняется CURRENT_TIMESTAMP, то есть в UTC
+    before = (datetime.utcnow() - timedelta(days=OUTBOX_KEEP_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    return db.purge_outbox(before)
+
+
+class Job:
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        # Первый запуск — сразу после старта
+        self.next_run = 0.0
+        self.last_rows = None
+
+
+def default_jobs():
+    return [
+        Job('deactivate_expired', deactivate_expired, DEACTIVATE_INTERVAL),
+        Job('archive_bookings', archive_bookings, ARCHIVE_INTERVAL),
+        Job('purge_outbox', purge_outbox, ARCHIVE_INTERVAL),
+    ]
+
+
+class JobRunner:
+    """Выполняет задачи по расписанию в одном фоновом потоке."""
+
+    def __init__(self, db, jobs=None):
+        self.db = db
+        self.jobs = jobs if jobs is not None else default_jobs()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_job(self, job):
+        started = time.perf_counter()
+        result = 'ok'
+        try:
+            rows = job.func(self.db)
+        except Exception:
+            # Ошибка одной задачи не останавливает остальные; повтор — в следующий раз
+            logger.exception('job %s failed', job.name)
+            result = 'error'
+            rows = 0
+        elapsed = time.perf_counter() - started
+        metrics.JOB_RUNS.inc(job=job.name, result=result)
+        metrics.JOB_ROWS.inc(rows, job=job.name)
+        metrics.JOB_SECONDS.observe(elapsed, job=job.name)
+        job.last_rows = rows
+        logger.info('job %s: %s, %d rows in %.2fs', job.name, result, rows, elapsed)
+        return rows
+
+    def run_pending(self):
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.next_run <= now:
+                self.run_job(job)
+                job.next_run = time.monotonic() + job.interval
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            wait = min(job.next_run for job in self.jobs) - time.monotonic()
+            self._stop.wait(max(wait, 0))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name='jobs', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,98 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+import jobs
+import migrations
+import query_plans
+from database import Database
+
+
+def open_database(args):
+    # --url (DATABASE_URL) — хранилище на SQLAlchemy, иначе файл SQLite --db
+    if args.url:
+        from repository import SqlRepository
+        return SqlRepository(args.url)
+    return Database(args.db)
+
+
+def cmd_migrate(args):
+    conn = sqlite3.connect(args.db)
+    applied = migrations.migrate(conn)
+    print(f"applied: {applied or 'nothing'}, schema version: {migrations.get_version(conn)}")
+    return 0
+
+
+def cmd_check_plans(args):
+    # Падает с кодом 1, если какой-то горячий запрос сканирует таблицу целиком.
+    # Запросы снимаются с методов Database на временной базе, планы — по --db
+    with tempfile.TemporaryDirectory() as scratch:
+        queries = query_plans.trace_queries(Database(os.path.join(scratch, 'plans.db')))
+    conn = sqlite3.connect(args.db)
+    migrations.migrate(conn)
+    scans = query_plans.find_table_scans(conn, queries)
+    for name, plan in scans.items():
+        print(f"FULL SCAN in {name}: {' | '.join(plan)}")
+    for name, reason in query_plans.ALLOWED_SCANS.items():
+        print(f"allowed scan in {name}: {reason}")
+    if not scans:
+        print(f"all {len(queries)} hot queries use indexes")
+    return 1 if scans else 0
+
+
+def cmd_occupancy(args):
+    # Сверка slot_occupancy с bookings; --rebuild пересчитывает таблицу
+    db = open_database(args)
+    drift = db.verify_occupancy()
+    for trainer_id, booking_date, booking_time, stored, actual in drift[:args.show]:
+        print(f"DRIFT trainer {trainer_id} {booking_date} {booking_time}: stored {stored}, actual {actual}")
+    if len(drift) > args.show:
+        print(f"... and {len(drift) - args.show} more")
+    print(f"slots with drift: {len(drift)}")
+    if args.rebuild:
+        print(f"rebuilt: {db.rebuild_occupancy()} slots")
+        return 0
+    return 1 if drift else 0
+
+
+def cmd_jobs(args):
+    # Фоновые задачи отдельным процессом; --once — один проход и выход
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    selected = [job for job in jobs.default_jobs() if not args.job or job.name in args.job]
+    runner = jobs.JobRunner(open_database(args), selected)
+    if args.once:
+        for job in selected:
+            runner.run_job(job)
+        return 0
+    try:
+        runner.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Служебные команды UNIO')
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', 'uniobot.db'), help='путь к базе SQLite')
+    parser.add_argument('--url', default=os.getenv('DATABASE_URL'),
+                        help='URL базы для SQLAlchemy (occupancy, jobs), например postgresql+psycopg2://...')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='применить миграции схемы').set_defaults(func=cmd_migrate)
+    commands.add_parser('check-plans', help='проверить планы горячих запросов').set_defaults(func=cmd_check_plans)
+    occupancy = commands.add_parser('occupancy', help='сверить занятость слотов с записями')
+    occupancy.add_argument('--rebuild', action='store_true', help='пересчитать slot_occupancy из bookings')
+    occupancy.add_argument('--show', type=int, default=20, help='сколько расхождений вывести')
+    occupancy.set_defaults(func=cmd_occupancy)
+    jobs_parser = commands.add_parser('jobs', help='запустить фоновые задачи обслуживания')
+    jobs_parser.add_argument('--once', action='store_true', help='выполнить задачи один раз и выйти')
+    jobs_parser.add_argument('--job', nargs='*', help='только указанные задачи')
+    jobs_parser.set_defaults(func=cmd_jobs)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
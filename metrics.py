@@ -0,0 +1,373 @@
+"""Метрики запросов в формате Prometheus (включаются METRICS_ENABLED=1).
+
+Собираются гистограммы времени ответа по маршрутам, число и суммарное
+время SQL-запросов на HTTP-запрос и вызовы Bot API. SQL считается через
+InstrumentedConnection — фабрику соединений для ConnectionProvider;
+статистика текущего HTTP-запроса живёт в contextvar, поэтому пул потоков
+и задачи asyncio должны запускаться в его контексте.
+
+Значения живут в памяти процесса. Под gunicorn с несколькими воркерами
+каждый сбор попадает в случайный воркер, поэтому:
+- с METRICS_DIR каждый процесс не чаще раза в FLUSH_INTERVAL секунд
+  сбрасывает свои значения в файл этого каталога, а /metrics складывает
+  файлы всех процессов (счётчики и корзины гистограмм суммируются).
+  Отстают соседи не больше чем на FLUSH_INTERVAL; файлы завершившихся
+  воркеров остаются, чтобы счётчики не убывали, — каталог очищает
+  gunicorn.conf.py при старте мастера;
+- без METRICS_DIR у каждого значения есть метка worker (pid процесса):
+  ответы разных воркеров различимы, складывать их — дело Prometheus.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+# Запросы с большим числом SQL-выражений попадают в лог (похоже на N+1)
+MAX_QUERIES = int(os.getenv('METRICS_MAX_QUERIES', '10'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+QUERY_COUNT_HEADER = 'X-SQL-Queries'
+QUERY_TIME_HEADER = 'X-SQL-Time-Ms'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Общий каталог для сложения метрик всех процессов; пусто — метка worker
+MULTIPROCESS_DIR = os.getenv('METRICS_DIR', '')
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+
+logger = logging.getLogger(__name__)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def snapshot(self):
+        # Копия значений: рендер и сброс в файл не держат блокировку
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def render(self, values=None, extra=()):
+        """Строки в формате Prometheus; values — значения вместо своих
+        (сложенные по процессам), extra — метки, общие для всех строк."""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.extend(self._samples(key, value, list(extra)))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value, extra):
+        return [f'{self.name}{self._format_labels(key, extra)} {value}']
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                # Счётчики по корзинам (+Inf последней), сумма, количество
+                data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][bisect_left(self.buckets, value)] += 1
+            data[1] += value
+            data[2] += 1
+
+    def _samples(self, key, data, extra):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), data[0]):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{self._format_labels(key, extra + [("le", str(bound))])} {cumulative}')
+        lines.append(f'{self.name}_sum{self._format_labels(key, extra)} {data[1]}')
+        lines.append(f'{self.name}_count{self._format_labels(key, extra)} {data[2]}')
+        return lines
+
+    @staticmethod
+    def _copy(data):
+        return [list(data[0]), data[1], data[2]]
+
+    @staticmethod
+    def merge(total, data):
+        return [[a + b for a, b in zip(total[0], data[0])], total[1] + data[1], total[2] + data[2]]
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency', ('route', 'method'))
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ('route', 'method', 'status'))
+REQUEST_SQL_QUERIES = Histogram('http_request_sql_queries', 'SQL statements per HTTP request', ('route',),
+                                COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('http_request_sql_seconds', 'SQL time per HTTP request', ('route',))
+REQUEST_TELEGRAM_CALLS = Histogram('http_request_telegram_calls', 'Bot API calls per HTTP request', ('route',),
+                                   COUNT_BUCKETS)
+SQL_STATEMENTS = Counter('sql_statements_total', 'SQL statements executed')
+TELEGRAM_SECONDS = Histogram('telegram_request_duration_seconds', 'Bot API call latency', ('method',))
+TELEGRAM_REQUESTS = Counter('telegram_requests_total', 'Bot API calls', ('method', 'result'))
+JOB_RUNS = Counter('job_runs_total', 'Background job runs', ('job', 'result'))
+JOB_ROWS = Counter('job_rows_processed_total', 'Rows processed by background jobs', ('job',))
+JOB_SECONDS = Histogram('job_duration_seconds', 'Background job run time', ('job',))
+RATE_LIMIT_DECISIONS = Counter('rate_limit_decisions_total', 'Rate limiter bucket checks', ('scope', 'result'))
+SINGLE_FLIGHT = Counter('single_flight_requests_total', 'Requests computed (leader) or coalesced', ('route', 'result'))
+
+REGISTRY = [REQUEST_SECONDS, REQUESTS, REQUEST_SQL_QUERIES, REQUEST_SQL_SECONDS, REQUEST_TELEGRAM_CALLS,
+            SQL_STATEMENTS, TELEGRAM_SECONDS, TELEGRAM_REQUESTS, JOB_RUNS, JOB_ROWS, JOB_SECONDS,
+            RATE_LIMIT_DECISIONS, SINGLE_FLIGHT]
+
+
+def render():
+    lines = []
+    if MULTIPROCESS_DIR:
+        flush()
+        merged = collect(MULTIPROCESS_DIR)
+        for metric in REGISTRY:
+            lines.extend(metric.render(merged.get(metric.name, {})))
+    else:
+        worker = [('worker', str(os.getpid()))]
+        for metric in REGISTRY:
+            lines.extend(metric.render(extra=worker))
+    return '\n'.join(lines) + '\n'
+
+
+# ----- Сложение по процессам (METRICS_DIR) -----
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def flush(directory=None):
+    """Сбрасывает значения процесса в <каталог>/metrics-<pid>.json."""
+    global _last_flush
+    directory = directory or MULTIPROCESS_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    with _flush_lock:
+        data = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for metric in REGISTRY}
+        # Запись во временный файл и замена: читатель не увидит половину
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+        _last_flush = time.monotonic()
+
+
+def maybe_flush():
+    if MULTIPROCESS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def collect(directory):
+    """{имя метрики: {ключ меток: значение}}, сложенные по файлам процессов."""
+    by_name = {metric.name: metric for metric in REGISTRY}
+    merged = {}
+    for filename in os.listdir(directory):
+        if not (filename.startswith('metrics-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, items in data.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in items:
+                key = tuple(key)
+                values[key] = metric.merge(values[key], value) if key in values else value
+    return merged
+
+
+def clear_directory(directory=None):
+    # Файлы прошлого запуска: иначе счётчики продолжились бы с их значений
+    directory = directory or MULTIPROCESS_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if filename.startswith('metrics-'):
+            os.remove(os.path.join(directory, filename))
+
+
+if MULTIPROCESS_DIR:
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+    # Последние значения завершающегося воркера (gunicorn выходит через sys.exit)
+    atexit.register(flush)
+
+
+# ----- Статистика текущего HTTP-запроса -----
+class RequestStats:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'telegram_count', 'telegram_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.telegram_count = 0
+        self.telegram_time = 0.0
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request(stats, route, method, status):
+    """Записывает метрики запроса; возвращает заголовки для ответа."""
+    _current.set(None)
+    elapsed = time.perf_counter() - stats.started
+    REQUEST_SECONDS.observe(elapsed, route=route, method=method)
+    REQUESTS.inc(route=route, method=method, status=status)
+    REQUEST_SQL_QUERIES.observe(stats.sql_count, route=route)
+    REQUEST_SQL_SECONDS.observe(stats.sql_time, route=route)
+    REQUEST_TELEGRAM_CALLS.observe(stats.telegram_count, route=route)
+    if stats.sql_count > MAX_QUERIES:
+        logger.warning('%s %s: %d SQL statements (%.1f ms), limit %d', method, route,
+                       stats.sql_count, stats.sql_time * 1000, MAX_QUERIES)
+    maybe_flush()
+    return {
+        QUERY_COUNT_HEADER: str(stats.sql_count),
+        QUERY_TIME_HEADER: f'{stats.sql_time * 1000:.2f}',
+    }
+
+
+def record_sql(elapsed, statements=0):
+    if statements:
+        SQL_STATEMENTS.inc(statements)
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_count += statements
+        stats.sql_time += elapsed
+
+
+def record_telegram(method, elapsed, ok):
+    TELEGRAM_SECONDS.observe(elapsed, method=method)
+    TELEGRAM_REQUESTS.inc(method=method, result='ok' if ok else 'error')
+    stats = _current.get()
+    if stats is not None:
+        stats.telegram_count += 1
+        stats.telegram_time += elapsed
+
+
+# ----- Учёт SQL -----
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, который считает выражения и время выполнения и выборки."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(time.perf_counter() - started, 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(time.perf_counter() - started, 1)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_sql(time.perf_counter() - started, 1)
+
+    # SQLite выполняет запрос по шагам во время выборки — её время тоже SQL
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            record_sql(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            record_sql(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record_sql(time.perf_counter() - started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            record_sql(time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, у которого execute* идут через InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory():
+    # Фабрика для ConnectionProvider: без метрик — обычное соединение
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
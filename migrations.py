@@ -0,0 +1,370 @@
+import sqlite3
+
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция переводит
+# базу с версии N-1 на N и выполняется в отдельной транзакции.
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def m001_initial_schema(conn):
+    # Таблица тренеров
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trainers (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER UNIQUE,
+            name TEXT,
+            phone TEXT,
+            specialty TEXT,
+            description TEXT,
+            photo TEXT,
+            subscription_end DATE,
+            is_active BOOLEAN DEFAULT 0
+        )
+    ''')
+    # Таблица расписания
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schedule (
+            id INTEGER PRIMARY KEY,
+            trainer_id INTEGER,
+            day_of_week INTEGER,
+            time TEXT,
+            max_clients INTEGER DEFAULT 1
+        )
+    ''')
+    # Таблица записей клиентов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY,
+            trainer_id INTEGER,
+            client_name TEXT,
+            client_phone TEXT,
+            telegram_id INTEGER,
+            booking_date DATE,
+            booking_time TEXT,
+            status TEXT DEFAULT 'active'
+        )
+    ''')
+    # Таблица отзывов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY,
+            trainer_id INTEGER,
+            user_id INTEGER,
+            user_name TEXT,
+            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+            text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def m002_trainer_rating_columns(conn):
+    # Денормализованный рейтинг тренера, заполняем его из reviews
+    columns = _columns(conn, 'trainers')
+    if 'rating_sum' not in columns:
+        conn.execute("ALTER TABLE trainers ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0")
+    if 'review_count' not in columns:
+        conn.execute("ALTER TABLE trainers ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+        UPDATE trainers SET
+            rating_sum = COALESCE((SELECT SUM(rating) FROM reviews WHERE reviews.trainer_id = trainers.user_id), 0),
+            review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.trainer_id = trainers.user_id)
+    ''')
+
+
+def m003_secondary_indexes(conn):
+    # Занятость слота: считаются только активные записи
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_slot_active
+        ON bookings (trainer_id, booking_date, booking_time) WHERE status = 'active'
+    ''')
+    # История записей клиента, сразу в порядке выдачи
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_telegram
+        ON bookings (telegram_id, booking_date, booking_time)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_schedule_trainer_day
+        ON schedule (trainer_id, day_of_week, time)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reviews_trainer_created
+        ON reviews (trainer_id, created_at)
+    ''')
+    conn.execute("ANALYZE")
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp._fts5_probe")
+    return True
+
+
+def m004_trainer_search_index(conn):
+    # Полнотекстовый индекс по тренерам (external content: данные живут в trainers).
+    # Без FTS5 в сборке SQLite поиск остаётся на LIKE
+    if not fts5_available(conn):
+        return
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS trainers_fts USING fts5(
+            name, specialty, description,
+            content='trainers', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trainers_fts_ai AFTER INSERT ON trainers BEGIN
+            INSERT INTO trainers_fts (rowid, name, specialty, description)
+            VALUES (new.id, new.name, new.specialty, new.description);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trainers_fts_ad AFTER DELETE ON trainers BEGIN
+            INSERT INTO trainers_fts (trainers_fts, rowid, name, specialty, description)
+            VALUES ('delete', old.id, old.name, old.specialty, old.description);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trainers_fts_au AFTER UPDATE OF name, specialty, description ON trainers BEGIN
+            INSERT INTO trainers_fts (trainers_fts, rowid, name, specialty, description)
+            VALUES ('delete', old.id, old.name, old.specialty, old.description);
+            INSERT INTO trainers_fts (rowid, name, specialty, description)
+            VALUES (new.id, new.name, new.specialty, new.description);
+        END
+    ''')
+    conn.execute("INSERT INTO trainers_fts (trainers_fts) VALUES ('rebuild')")
+
+
+# Фактическая занятость слотов по активным записям: источник для
+# заполнения и сверки slot_occupancy
+SLOT_OCCUPANCY_FROM_BOOKINGS = '''
+    SELECT trainer_id, booking_date, booking_time, COUNT(*) AS booked
+    FROM bookings WHERE status = 'active'
+    GROUP BY trainer_id, booking_date, booking_time
+'''
+
+
+def m005_slot_occupancy(conn):
+    # Число активных записей на слот в конкретную дату. Поддерживается
+    # Database при записи и отмене, поэтому свободные места — чтение по ключу
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS slot_occupancy (
+            trainer_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            booking_time TEXT NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trainer_id, booking_date, booking_time)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("DELETE FROM slot_occupancy")
+    conn.execute("INSERT INTO slot_occupancy (trainer_id, booking_date, booking_time, booked) "
+                 + SLOT_OCCUPANCY_FROM_BOOKINGS)
+
+
+def m006_bookings_archive(conn):
+    # Архив прошедших записей: фоновая задача переносит их из горячей bookings
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bookings_archive (
+            id INTEGER PRIMARY KEY,
+            trainer_id INTEGER,
+            client_name TEXT,
+            client_phone TEXT,
+            telegram_id INTEGER,
+            booking_date DATE,
+            booking_time TEXT,
+            status TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_archive_telegram
+        ON bookings_archive (telegram_id, booking_date, booking_time)
+    ''')
+    # Отбор записей на перенос по дате
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings (booking_date)")
+    # Истёкшие подписки среди активных тренеров
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_trainers_active_subscription
+        ON trainers (subscription_end) WHERE is_active = 1
+    ''')
+
+
+def m007_outbox(conn):
+    # Исходящие уведомления: пишутся в одной транзакции с записью/отменой,
+    # отправляет их notifier.py. idempotency_key не даёт поставить событие дважды
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            event TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+
+
+def m008_trainer_daily_stats(conn):
+    # Дневные итоги по тренеру для статистики в кабинете: записи и отмены
+    # по дате тренировки, отзывы по дате отзыва (UTC). Database обновляет их
+    # вместе с записью, отменой и отзывом; архивирование записей их не трогает
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trainer_daily_stats (
+            trainer_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trainer_id, day)
+        ) WITHOUT ROWID
+    ''')
+    backfill_daily_stats(conn)
+
+
+def backfill_daily_stats(conn):
+    # Итоги заново из bookings, bookings_archive и reviews — для записей и
+    # отзывов, вставленных в обход Database
+    conn.execute("DELETE FROM trainer_daily_stats")
+    conn.execute('''
+        INSERT INTO trainer_daily_stats (trainer_id, day, booked, cancelled)
+        SELECT trainer_id, booking_date, COUNT(*), SUM(status = 'cancelled')
+        FROM (
+            SELECT trainer_id, booking_date, status FROM bookings
+            UNION ALL
+            SELECT trainer_id, booking_date, status FROM bookings_archive
+        )
+        GROUP BY trainer_id, booking_date
+    ''')
+    # WHERE true: без него SQLite не отличит ON CONFLICT от условия JOIN
+    conn.execute('''
+        INSERT INTO trainer_daily_stats (trainer_id, day, reviews, rating_sum)
+        SELECT trainer_id, date(created_at), COUNT(*), SUM(rating) FROM reviews WHERE true
+        GROUP BY trainer_id, date(created_at)
+        ON CONFLICT (trainer_id, day) DO UPDATE SET reviews = excluded.reviews, rating_sum = excluded.rating_sum
+    ''')
+
+
+def backfill_booking_changes(conn):
+    # Записям, вставленным в обход Database: имя тренера и номер изменения
+    # по порядку id; счётчик продолжается с наибольшего номера
+    for table in ('bookings', 'bookings_archive'):
+        conn.execute(f'''
+            UPDATE {table} SET
+                trainer_name = (SELECT name FROM trainers WHERE trainers.user_id = {table}.trainer_id),
+                change_seq = id
+        ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO change_sequence (name, value)
+        SELECT 'bookings', COALESCE(MAX(id), 0) FROM (SELECT id FROM bookings UNION ALL SELECT id FROM bookings_archive)
+    ''')
+
+
+def m009_booking_changes(conn):
+    # Снимок имени тренера в записи (список записей клиента без JOIN) и
+    # номер изменения для синхронизации (since): он берётся из общего
+    # счётчика при записи и при отмене
+    for table in ('bookings', 'bookings_archive'):
+        columns = _columns(conn, table)
+        if 'trainer_name' not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN trainer_name TEXT")
+        if 'change_seq' not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_sequence (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    backfill_booking_changes(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_telegram_changes ON bookings (telegram_id, change_seq)")
+
+
+def m010_bookings_autoincrement(conn):
+    # Без AUTOINCREMENT SQLite выдаёт новой записи MAX(id) + 1 и после
+    # архивирования повторяет id, уже лежащие в bookings_archive. Таблицу
+    # пересоздаём с AUTOINCREMENT, счётчик начинаем за обеими таблицами
+    indexes = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'bookings' AND sql IS NOT NULL"
+    )]
+    conn.execute('''
+        CREATE TABLE bookings_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trainer_id INTEGER,
+            client_name TEXT,
+            client_phone TEXT,
+            telegram_id INTEGER,
+            booking_date DATE,
+            booking_time TEXT,
+            status TEXT DEFAULT 'active',
+            trainer_name TEXT,
+            change_seq INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    columns = ('id, trainer_id, client_name, client_phone, telegram_id, booking_date, booking_time, status, '
+               'trainer_name, change_seq')
+    conn.execute(f"INSERT INTO bookings_new ({columns}) SELECT {columns} FROM bookings")
+    conn.execute("DROP TABLE bookings")
+    conn.execute("ALTER TABLE bookings_new RENAME TO bookings")
+    for sql in indexes:
+        conn.execute(sql)
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'bookings'")
+    conn.execute('''
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'bookings', COALESCE(MAX(id), 0) FROM (SELECT id FROM bookings UNION ALL SELECT id FROM bookings_archive)
+    ''')
+
+
+MIGRATIONS = [
+    m001_initial_schema,
+    m002_trainer_rating_columns,
+    m003_secondary_indexes,
+    m004_trainer_search_index,
+    m005_slot_occupancy,
+    m006_bookings_archive,
+    m007_outbox,
+    m008_trainer_daily_stats,
+    m009_booking_changes,
+    m010_bookings_autoincrement,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """Применяет недостающие миграции, возвращает список применённых версий."""
+    applied = []
+    if get_version(conn) >= target:
+        return applied
+    for version in range(1, target + 1):
+        # BEGIN IMMEDIATE + повторная проверка версии: параллельно
+        # стартующие воркеры не применят одну миграцию дважды
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            MIGRATIONS[version - 1](conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,57 @@
+"""Строки выборок для списков API: компактные объекты со __slots__.
+
+Database и SqlRepository создают их прямо из строк курсора (row_factory),
+маршруты отдают их в JSON без промежуточных словарей: orjson сериализует
+dataclass сам, стандартный провайдер Flask — через dataclasses.asdict.
+Имена полей — ключи ответа API.
+"""
+from dataclasses import dataclass, field
+
+DAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+@dataclass(slots=True)
+class ScheduleSlot:
+    id: int
+    day: int
+    time: str
+    max_clients: int
+    day_name: str = field(init=False)
+
+    def __post_init__(self):
+        self.day_name = DAY_NAMES[self.day - 1] if 1 <= self.day <= 7 else ''
+
+
+@dataclass(slots=True)
+class TrainerBooking:
+    id: int
+    client_name: str
+    client_phone: str
+    date: str
+    time: str
+
+    @property
+    def key(self):
+        # Ключ keyset-пагинации: порядок выдачи (дата, время, id)
+        return (self.date, self.time, self.id)
+
+
+@dataclass(slots=True)
+class ClientBooking:
+    id: int
+    trainer_id: int
+    name: str
+    booking_date: str
+    booking_time: str
+    status: str
+    # Номер последнего изменения записи: для синхронизации через since
+    version: int
+
+    @property
+    def key(self):
+        return (self.booking_date, self.booking_time, self.id)
+
+
+def row_factory(model):
+    # sqlite3 row_factory: строка сразу становится объектом модели
+    return lambda cursor, row: model(*row)
@@ -0,0 +1,194 @@
+"""Воркер уведомлений: разбирает outbox и отправляет сообщения через aiogram.
+
+Database пишет событие в outbox в той же транзакции, что и запись или
+отмену, поэтому запрос к API не ждёт Telegram. Воркер забирает события
+пачками, соблюдает лимиты Bot API (не чаще раза в PER_CHAT_INTERVAL
+секунд в один чат и не больше GLOBAL_RATE сообщений в секунду всего),
+повторяет временные ошибки с экспоненциальной задержкой. idempotency_key
+не даёт поставить одно событие в очередь дважды, а аренда (status
+'sending') — отправить его двумя воркерами одновременно.
+
+TELEGRAM_API_URL направляет бота на локальную заглушку Bot API:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python notifier.py
+"""
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from dotenv import load_dotenv
+
+import metrics
+from database import Database
+from telegram_files import TELEGRAM_API_URL
+
+BATCH_SIZE = 50
+# Пустой outbox опрашивается с такой паузой, секунды
+POLL_INTERVAL = 1.0
+# Ограничения Bot API: ~1 сообщение в секунду в чат, ~30 в секунду всего
+PER_CHAT_INTERVAL = 1.0
+GLOBAL_RATE = 25
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+# Сколько секунд событие закреплено за воркером, забравшим его
+LEASE = 60
+
+logger = logging.getLogger(__name__)
+
+MESSAGES = {
+    ('booked', 'trainer'): 'Новая запись: {client_name}, {client_phone}\n{date} в {time}',
+    ('booked', 'client'): 'Вы записаны на тренировку {date} в {time}',
+    ('cancelled', 'trainer'): 'Запись отменена: {client_name}, {date} в {time}',
+    ('cancelled', 'client'): 'Ваша запись на {date} в {time} отменена',
+}
+
+
+def render(event, payload):
+    return MESSAGES[(event, payload['role'])].format(**payload)
+
+
+def backoff(attempts, base=BACKOFF_BASE, limit=BACKOFF_MAX):
+    # Экспонента с разбросом, чтобы повторы разных событий не шли залпом
+    delay = min(limit, base ** attempts)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RateLimiter:
+    """Интервалы между сообщениями в один чат и между любыми сообщениями."""
+
+    def __init__(self, per_chat_interval=PER_CHAT_INTERVAL, global_rate=GLOBAL_RATE):
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_rate
+        self._chat_next = {}
+        self._global_next = 0.0
+
+    async def wait(self, chat_id):
+        # Слот резервируется до await, поэтому одновременные вызовы не пересекаются
+        now = time.monotonic()
+        at = max(now, self._chat_next.get(chat_id, 0.0), self._global_next)
+        self._chat_next[chat_id] = at + self.per_chat_interval
+        self._global_next = at + self.global_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {chat: t for chat, t in self._chat_next.items() if t > now}
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def defer(self, chat_id, seconds):
+        # После 429 чат молчит столько, сколько попросил Telegram
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), time.monotonic() + seconds)
+
+
+class OutboxWorker:
+    def __init__(self, db, bot, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL,
+                 max_attempts=MAX_ATTEMPTS, limiter=None, lease=LEASE, backoff_base=BACKOFF_BASE):
+        self.db = db
+        self.bot = bot
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.limiter = limiter or RateLimiter()
+        self.lease = lease
+        self.backoff_base = backoff_base
+        # Своё соединение SQLite у потока; один поток — запись всё равно одна
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox-db')
+        self._stopping = False
+
+    async def _db(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(getattr(self.db, method), *args, **kwargs))
+
+    async def _send(self, item, result):
+        outbox_id, key, event, chat_id, payload, attempts = item
+        await self.limiter.wait(chat_id)
+        started = time.perf_counter()
+        ok = False
+        try:
+            await self.bot.send_message(chat_id, render(event, payload))
+        except TelegramRetryAfter as exc:
+            self.limiter.defer(chat_id, exc.retry_after)
+            result['retry'].append((outbox_id, time.time() + exc.retry_after, str(exc)))
+        except (TelegramForbiddenError, TelegramBadRequest) as exc:
+            # Бот заблокирован или чат не существует — повтор не поможет
+            result['failed'].append((outbox_id, str(exc)))
+        except (TelegramAPIError, asyncio.TimeoutError, OSError) as exc:
+            if attempts >= self.max_attempts:
+                result['failed'].append((outbox_id, str(exc)))
+            else:
+                result['retry'].append((outbox_id, time.time() + backoff(attempts, self.backoff_base), str(exc)))
+        else:
+            ok = True
+            result['sent'].append(outbox_id)
+        metrics.record_telegram('sendMessage', time.perf_counter() - started, ok)
+
+    async def _send_chat(self, items, result):
+        # Сообщения одного чата — по очереди и в порядке событий
+        for item in items:
+            await self._send(item, result)
+
+    async def run_once(self):
+        """Одна пачка событий; возвращает {'sent', 'retry', 'failed'} со списками."""
+        batch = await self._db('claim_outbox', self.batch_size, self.lease)
+        result = {'sent': [], 'retry': [], 'failed': []}
+        if not batch:
+            return result
+        by_chat = {}
+        for item in batch:
+            by_chat.setdefault(item[3], []).append(item)
+        await asyncio.gather(*(self._send_chat(items, result) for items in by_chat.values()))
+        await self._db('complete_outbox', result['sent'], result['retry'], result['failed'])
+        logger.info('outbox: sent %d, retry %d, failed %d',
+                    len(result['sent']), len(result['retry']), len(result['failed']))
+        return result
+
+    async def run_forever(self):
+        while not self._stopping:
+            result = await self.run_once()
+            if not any(result.values()):
+                await asyncio.sleep(self.poll_interval)
+
+    def stop(self):
+        self._stopping = True
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def create_bot(token, api_url=None):
+    session = AiohttpSession(api=TelegramAPIServer.from_base((api_url or TELEGRAM_API_URL).rstrip('/')))
+    return Bot(token, session=session)
+
+
+async def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', 'uniobot.db'))
+    parser.add_argument('--url', default=os.getenv('DATABASE_URL'), help='URL базы для SQLAlchemy вместо --db')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    bot = create_bot(os.getenv('BOT_TOKEN'))
+    if args.url:
+        from repository import SqlRepository
+        db = SqlRepository(args.url)
+    else:
+        db = Database(args.db)
+    worker = OutboxWorker(db, bot, batch_size=args.batch)
+    try:
+        await worker.run_forever()
+    finally:
+        worker.close()
+        await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime
+
+# Размер страницы по умолчанию и максимальный. Старые клиенты без limit
+# получают первую страницу этого размера — память на запрос ограничена
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# Типы полей ключа страницы у каждого списка
+BOOKING_CURSOR = (str, str, int)   # (дата, время, id) — записи тренера и клиента
+VERSION_CURSOR = (int,)            # (version,) — записи клиента с since
+REVIEW_CURSOR = (str, int)         # (created_at, id)
+ID_CURSOR = (int,)                 # (id,) каталога или смещение в поиске
+
+
+def encode_cursor(key):
+    # Курсор непрозрачен для клиента: ключ последней строки в base64(JSON)
+    raw = json.dumps(list(key), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, shape=None):
+    """Возвращает ключ строки или None; ValueError для битого курсора.
+
+    shape — типы полей ключа (BOOKING_CURSOR и т.п.): курсор другого
+    списка или другой длины отклоняется, не доходя до SQL.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or not key or not all(isinstance(v, (int, str)) for v in key):
+        raise ValueError('Invalid cursor')
+    key = tuple(key)
+    if shape is not None:
+        check_cursor(key, shape)
+    return key
+
+
+def check_cursor(key, shape):
+    # bool — подкласс int, но в ключах его не бывает; int — в пределах INTEGER SQLite
+    if len(key) != len(shape) or not all(type(v) is t for v, t in zip(key, shape)):
+        raise ValueError('Invalid cursor')
+    if any(type(v) is int and not -2 ** 63 <= v < 2 ** 63 for v in key):
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value, default=MAX_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    limit = int(value)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_booking_filters(args, statuses, after=None):
+    """status, from, to и since для списка записей клиента; ValueError с текстом ошибки.
+
+    С since курсор — (version,), без него — (дата, время, id).
+    """
+    status = args.get('status') or None
+    if status is not None and status not in statuses:
+        raise ValueError('Invalid status')
+    try:
+        date_from, date_to = (datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d') if value else None
+                              for value in (args.get('from'), args.get('to')))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date')
+    since = args.get('since')
+    if since in (None, ''):
+        since = None
+    else:
+        # Отменённые записи since отдаёт всегда, поэтому со status не сочетается
+        if not since.isdigit() or int(since) >= 2 ** 63 or status is not None:
+            raise ValueError('Invalid since')
+        since = int(since)
+    if after:
+        try:
+            check_cursor(after, VERSION_CURSOR if since is not None else BOOKING_CURSOR)
+        except ValueError:
+            raise ValueError('Invalid pagination parameters')
+    return status, date_from, date_to, since
@@ -0,0 +1,111 @@
+"""Проверка планов горячих запросов на полное сканирование таблиц.
+
+Используется командой python manage.py check-plans.
+"""
+
+# Горячие вызовы Database с примерными аргументами. Их SQL не копируется
+# сюда руками: trace_queries выполняет методы на отдельной базе и
+# перехватывает настоящие выражения, поэтому правка запроса в database.py
+# сразу попадает в проверку. Записи идут первыми — они же готовят данные
+# для чтений. Каждое выражение обязано идти по индексу.
+HOT_CALLS = {
+    'add_trainer': ('add_trainer', (1, 'Анна', '+70000000000')),
+    'activate_subscription': ('activate_subscription', (1, 30)),
+    'update_trainer_profile': ('update_trainer_profile', (1, 'йога', 'описание', 'file-id')),
+    'add_schedule': ('add_schedule', (1, 1, '10:00', 2)),
+    'book_slot': ('book_slot', (1, 'Иван', '+71111111111', 5, '2024-01-01', '10:00')),
+    'add_review': ('add_review', (1, 7, 'Пётр', 5, 'отлично')),
+    'cancel_booking': ('cancel_booking', (1,)),
+    'get_trainer_status': ('get_trainer_status', (1,)),
+    'get_trainer_by_id': ('get_trainer_by_id', (1,)),
+    'get_trainer_schedule': ('get_trainer_schedule', (1,)),
+    'list_trainer_bookings': ('list_trainer_bookings', (1, None, 50, ('2024-01-01', '10:00', 5))),
+    'list_trainer_bookings_by_date': ('list_trainer_bookings', (1, '2024-01-01', 50, ('2024-01-01', '10:00', 5))),
+    'list_client_bookings': ('list_client_bookings', (5, 50)),
+    'list_client_bookings_filtered': ('list_client_bookings', (5, 50, ('2024-01-01', '10:00', 5), 'active',
+                                                               '2024-01-01', '2024-01-31')),
+    'client_bookings_since': ('list_client_bookings', (5, 50, None, None, None, None, 100)),
+    'list_trainers': ('list_trainers', (50,)),
+    'list_trainers_after': ('list_trainers', (50, (100,))),
+    'get_all_trainers': ('get_all_trainers', ()),
+    'search_trainers': ('get_all_trainers', ('йог', 21, 0)),
+    'list_trainer_reviews': ('list_trainer_reviews', (1, 50)),
+    'list_trainer_reviews_after': ('list_trainer_reviews', (1, 50, ('2024-01-01 10:00:00', 5))),
+    'get_availability': ('get_availability', (1, '2024-01-01', '2024-01-07')),
+    'upcoming_bookings': ('list_upcoming_bookings', (1, '2024-01-01', '2024-01-07', 100)),
+    'daily_stats': ('get_daily_stats', (1, '2023-11-07', '2024-01-01')),
+    'expired_trainers': ('deactivate_expired_trainers', ('2024-01-01',)),
+    'archive_batch': ('archive_bookings', ('2024-01-01',)),
+    'outbox_due': ('claim_outbox', ()),
+}
+
+# Осознанные полные сканы: {вызов: причина}. Каталог — почти все строки
+# таблицы (неактивных тренеров мало), первая страница list_trainers читает
+# trainers по порядку rowid и останавливается на LIMIT
+ALLOWED_SCANS = {
+    'list_trainers': 'первая страница каталога: скан по rowid до LIMIT',
+    'get_all_trainers': 'весь каталог: возвращает почти все строки trainers',
+}
+
+# Выражения, у которых есть план; BEGIN, PRAGMA и прочее пропускаются
+_PLANNED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _is_hot(sql):
+    # Служебные запросы FTS5 к своим таблицам ('main'.'trainers_fts_…') и
+    # разовая проверка схемы по sqlite_master — не наши горячие запросы
+    if "'main'." in sql or 'sqlite_master' in sql:
+        return False
+    return sql.lstrip().split(None, 1)[0].upper() in _PLANNED
+
+
+def trace_queries(db, calls=None):
+    """Выполняет вызовы на db и возвращает {имя: (SQL, ())} для find_table_scans.
+
+    db — Database на отдельной (временной) базе: вызовы в неё пишут. SQL
+    приходит из set_trace_callback уже с подставленными параметрами; если
+    вызов выполнил несколько выражений, к имени добавляется [номер].
+    """
+    conn = db.conn
+    queries = {}
+    for name, (method, args) in (calls or HOT_CALLS).items():
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            getattr(db, method)(*args)
+        finally:
+            conn.set_trace_callback(None)
+        # Пока работают триггеры, trace повторяет текст внешнего выражения
+        statements = [sql for sql in dict.fromkeys(statements) if _is_hot(sql)]
+        for number, sql in enumerate(statements):
+            queries[name if len(statements) == 1 else f'{name}[{number}]'] = (sql, ())
+    return queries
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def find_table_scans(conn, queries, allowed=ALLOWED_SCANS):
+    """Возвращает {имя запроса: план} для запросов с полным сканированием.
+
+    queries — {имя: (SQL, параметры)}, обычно из trace_queries; вызовы из
+    allowed не проверяются.
+    """
+    problems = {}
+    for name, (sql, params) in queries.items():
+        if name.split('[', 1)[0] in allowed:
+            continue
+        plan = explain(conn, sql, params)
+        # Сканы CTE и подзапросов (MATERIALIZE/CO-ROUTINE) таблиц не трогают
+        derived = {'CONSTANT ROW'}
+        derived.update(step.split(' ', 1)[1] for step in plan if step.startswith(('MATERIALIZE ', 'CO-ROUTINE ')))
+        for step in plan:
+            # SCAN по виртуальной таблице FTS5 с MATCH — это поиск по её индексу
+            if ' VIRTUAL TABLE INDEX ' in step:
+                continue
+            if step.startswith('SCAN ') and ' USING ' not in step and step[5:] not in derived:
+                problems[name] = plan
+                break
+    return problems
+
@@ -0,0 +1,169 @@
+"""Ограничение частоты запросов к публичным спискам: token bucket.
+
+Ведро у каждого IP и, если запрос подписан Mini App (заголовок
+X-Telegram-Init-Data с проверенной подписью initData), у пользователя
+Telegram. Ведро вмещает burst запросов и пополняется на rate в секунду;
+запрос проходит, только если токен есть в обоих вёдрах.
+
+Вёдра по умолчанию в памяти процесса (MemoryStore, у каждого воркера
+свои), SqliteStore делит их между воркерами одного хоста. Другое общее
+хранилище — любой объект с методом take(key, rate, burst, now).
+Включается RATE_LIMIT_ENABLED=1; за обратным прокси нужно задать
+RATE_LIMIT_PROXIES — иначе все клиенты окажутся с адресом прокси.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+import metrics
+from connections import ConnectionProvider
+
+ENABLED = os.getenv('RATE_LIMIT_ENABLED', '0') == '1'
+# Запросов в секунду и размер всплеска: на пользователя и на IP. За одним
+# IP (мобильный оператор, NAT) бывает много пользователей — лимит выше
+USER_RATE = float(os.getenv('RATE_LIMIT_USER_RATE', '5'))
+USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', '30'))
+IP_RATE = float(os.getenv('RATE_LIMIT_IP_RATE', '20'))
+IP_BURST = float(os.getenv('RATE_LIMIT_IP_BURST', '100'))
+# Число доверенных прокси перед приложением (адрес клиента — из X-Forwarded-For)
+PROXIES = int(os.getenv('RATE_LIMIT_PROXIES', '0'))
+# Файл SQLite для общих вёдер; пусто — в памяти процесса
+STORE_PATH = os.getenv('RATE_LIMIT_STORE', '')
+
+INIT_DATA_HEADER = 'X-Telegram-Init-Data'
+
+
+def take(state, rate, burst, now):
+    """Шаг token bucket: (новое состояние, сколько ждать; 0 — токен взят).
+
+    state — (токены, время обновления) или None для нового ведра.
+    """
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryStore:
+    """Вёдра в памяти процесса; самые давно не использованные вытесняются."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            state, wait = take(self._buckets.get(key), rate, burst, now)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SqliteStore:
+    """Вёдра в отдельном файле SQLite — общие для воркеров одного хоста.
+
+    Файл лучше держать на tmpfs. Если блокировку не удалось получить за
+    busy_timeout, запрос пропускается: ограничитель не должен ронять API.
+    """
+
+    def __init__(self, path, busy_timeout=50, cleanup_every=1000):
+        self.connections = ConnectionProvider(path, busy_timeout=busy_timeout, synchronous='OFF')
+        self.cleanup_every = cleanup_every
+        self._calls = 0
+        self.connections.connection().execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def take(self, key, rate, burst, now):
+        try:
+            with self.connections.transaction() as conn:
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                state, wait = take(row, rate, burst, now)
+                conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                             (key, *state))
+                self._calls += 1
+                if self._calls % self.cleanup_every == 0:
+                    # Ведро, не трогавшееся час, давно полное — строка не нужна
+                    conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - 3600,))
+        except sqlite3.OperationalError:
+            return 0.0
+        return wait
+
+
+def telegram_user_id(init_data, secret):
+    """id пользователя из initData Mini App или None, если подпись не сходится.
+
+    secret — HMAC-SHA256 токена бота с ключом "WebAppData" (init_data_secret).
+    """
+    if not init_data or not secret:
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash', '')
+    check = '\n'.join(f'{name}={value}' for name, value in sorted(fields.items()))
+    expected = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        return None
+    try:
+        return int(json.loads(fields['user'])['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def init_data_secret(bot_token):
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest() if bot_token else None
+
+
+def client_ip(remote_addr, forwarded_for=None, proxies=PROXIES):
+    # Каждый доверенный прокси дописывает адрес справа: клиент — proxies-й с конца
+    if proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return remote_addr
+
+
+class RateLimiter:
+    def __init__(self, bot_token=None, store=None, user_rate=USER_RATE, user_burst=USER_BURST,
+                 ip_rate=IP_RATE, ip_burst=IP_BURST, clock=time.time):
+        self.store = store or MemoryStore()
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.clock = clock
+        self._secret = init_data_secret(bot_token)
+
+    def check(self, ip, init_data=None):
+        """Сколько секунд подождать клиенту; 0 — запрос можно выполнять."""
+        now = self.clock()
+        wait = self._take('ip', ip, self.ip_rate, self.ip_burst, now)
+        user_id = telegram_user_id(init_data, self._secret)
+        if user_id is not None:
+            wait = max(wait, self._take('user', user_id, self.user_rate, self.user_burst, now))
+        return wait
+
+    def _take(self, scope, key, rate, burst, now):
+        wait = self.store.take(f'{scope}:{key}', rate, burst, now)
+        metrics.RATE_LIMIT_DECISIONS.inc(scope=scope, result='rejected' if wait else 'allowed')
+        return wait
+
+
+def from_env(bot_token):
+    """RateLimiter по переменным окружения или None, если ограничение выключено."""
+    if not ENABLED:
+        return None
+    return RateLimiter(bot_token, SqliteStore(STORE_PATH) if STORE_PATH else None)
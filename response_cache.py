@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from pagination import NEXT_CURSOR_HEADER
+
+# Ответ всегда перепроверяется по ETag: повторный запрос стоит 304 без тела
+CACHE_CONTROL = 'no-cache'
+# Заголовки ответа, которые сохраняются вместе с телом
+CACHED_HEADERS = ('Content-Type', NEXT_CURSOR_HEADER)
+# Тег записей со списками тренеров: их затрагивает изменение любого тренера
+CATALOG = 'catalog'
+
+
+def trainer_tag(trainer_id):
+    # trainer_id из JSON может прийти строкой — приводим к одному виду
+    try:
+        trainer_id = int(trainer_id)
+    except (TypeError, ValueError):
+        pass
+    return f'trainer:{trainer_id}'
+
+
+def make_etag(body):
+    # Сильный ETag без кавычек; в заголовок он попадает как "<etag>"
+    return hashlib.sha1(body).hexdigest()
+
+
+def cache_key(path, args):
+    # Порядок параметров запроса на ключ не влияет
+    return path + '?' + urlencode(sorted(args))
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'headers', 'tags', 'expires')
+
+    def __init__(self, body, headers, tags, expires):
+        self.body = body
+        self.etag = make_etag(body)
+        self.headers = headers
+        self.tags = tags
+        self.expires = expires
+
+
+class ResponseCache:
+    """Кэш готовых ответов в памяти процесса с инвалидацией по тегам.
+
+    Каждый воркер держит свой кэш и узнаёт только о своих записях в базу,
+    поэтому TTL ограничивает устаревание данных, изменённых соседними
+    процессами.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, headers, tags, generation=None):
+        """Сохраняет ответ. Если с момента generation была инвалидация,
+        ответ мог быть построен по старым данным и не кэшируется."""
+        entry = CachedResponse(body, headers, frozenset(tags), time.monotonic() + self.ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def on_database_change(self, event, trainer_id):
+        # Подписчик Database.add_listener. Записи клиентов не меняют каталог,
+        # поэтому сбрасывают только ответы своего тренера
+        if event == 'booking':
+            self.invalidate(trainer_tag(trainer_id))
+        else:
+            self.invalidate(trainer_tag(trainer_id), CATALOG)
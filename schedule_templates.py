@@ -0,0 +1,133 @@
+"""Разбор недельного шаблона расписания для пакетного API.
+
+Слоты задаются списком {"day": 1, "time": "09:00", "max_clients": 3} и/или
+правилами повторения:
+
+    {"days": "1-5", "from": "08:00", "to": "20:00", "every": 60, "max_clients": 3}
+
+— с понедельника по пятницу каждый час, начала занятий с 08:00 до 19:00
+(граница "to" не включается). days — список номеров (1 — понедельник)
+или строка вида "1-5" / "1,3,5". Ошибки формата — ValueError с текстом
+для ответа клиенту.
+"""
+from datetime import datetime, timedelta
+
+# Больше слотов на неделю не бывает: 7 дней по 15 минут — 672
+MAX_SLOTS = 700
+MIN_EVERY = 15
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(str(value), '%H:%M')
+    except ValueError:
+        raise ValueError(f'Invalid time: {value}')
+
+
+def parse_day(value):
+    try:
+        day = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid day: {value}')
+    if not 1 <= day <= 7:
+        raise ValueError(f'Invalid day: {value}')
+    return day
+
+
+def parse_capacity(value):
+    try:
+        max_clients = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid max_clients: {value}')
+    if max_clients < 1:
+        raise ValueError(f'Invalid max_clients: {value}')
+    return max_clients
+
+
+def parse_days(value):
+    if isinstance(value, str):
+        days = []
+        for part in value.split(','):
+            first, _, last = part.strip().partition('-')
+            first = parse_day(first)
+            last = parse_day(last) if last else first
+            if last < first:
+                raise ValueError(f'Invalid days: {value}')
+            days.extend(range(first, last + 1))
+        return sorted(set(days))
+    if isinstance(value, list) and value:
+        return sorted({parse_day(day) for day in value})
+    raise ValueError(f'Invalid days: {value}')
+
+
+def parse_list(value, name):
+    # Не заданное поле — пустой список; число или объект — ошибка, а не итерация по ключам
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValueError(f'{name} must be a list')
+    return value
+
+
+def slot_key(item):
+    # {"day", "time"} -> (день, "ЧЧ:ММ") в том виде, в каком слот хранится в базе
+    if not isinstance(item, dict):
+        raise ValueError('Slot must be an object')
+    return parse_day(item.get('day')), parse_time(item.get('time')).strftime('%H:%M')
+
+
+def expand_rule(rule):
+    if not isinstance(rule, dict):
+        raise ValueError('Rule must be an object')
+    days = parse_days(rule.get('days'))
+    start = parse_time(rule.get('from'))
+    end = parse_time(rule.get('to'))
+    try:
+        every = int(rule.get('every', 60))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid every: {rule.get('every')}")
+    if every < MIN_EVERY:
+        raise ValueError(f'every must be at least {MIN_EVERY} minutes')
+    if end <= start:
+        raise ValueError('Rule "to" must be later than "from"')
+    max_clients = parse_capacity(rule.get('max_clients', 1))
+    times = []
+    current = start
+    while current < end:
+        times.append(current.strftime('%H:%M'))
+        current += timedelta(minutes=every)
+    return [(day, time, max_clients) for day in days for time in times]
+
+
+def expand(slots=None, rules=None):
+    """Шаблон недели -> список (день, время, max_clients) без повторов.
+
+    Если слот задан несколько раз, действует последнее упоминание:
+    отдельные slots применяются после правил.
+    """
+    desired = {}
+    for rule in parse_list(rules, 'rules'):
+        for day, time, max_clients in expand_rule(rule):
+            desired[(day, time)] = max_clients
+        if len(desired) > MAX_SLOTS:
+            break
+    for item in parse_list(slots, 'slots'):
+        desired[slot_key(item)] = parse_capacity(item.get('max_clients', 1))
+        if len(desired) > MAX_SLOTS:
+            break
+    if len(desired) > MAX_SLOTS:
+        raise ValueError(f'Too many slots, limit is {MAX_SLOTS}')
+    return [(day, time, max_clients) for (day, time), max_clients in sorted(desired.items())]
+
+
+def parse_deletes(items):
+    """delete: id слотов и/или {"day", "time"} -> (ids, ключи)."""
+    ids, keys = set(), set()
+    for item in parse_list(items, 'delete'):
+        if isinstance(item, dict):
+            keys.add(slot_key(item))
+        elif isinstance(item, int) and not isinstance(item, bool):
+            ids.add(item)
+        else:
+            raise ValueError(f'Invalid delete item: {item}')
+    return ids, keys
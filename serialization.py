@@ -0,0 +1,54 @@
+"""Быстрая сериализация JSON для ответов API.
+
+С установленным orjson ответы кодируются им сразу в байты (dataclass из
+models.py — без промежуточных словарей), без него — стандартным json.
+Вывод orjson — UTF-8 без \\u-экранирования, ключи словарей сортируются,
+как у провайдера Flask по умолчанию; даты по-прежнему в формате HTTP.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # NON_STR_KEYS: ключи-числа становятся строками, как у json.dumps
+    OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps_bytes(obj, default=DefaultJSONProvider.default):
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=OPTIONS)
+    return json.dumps(obj, default=default, sort_keys=True, separators=(',', ':')).encode()
+
+
+def dumps(obj):
+    # Для aiohttp: json_response(dumps=...) ждёт строку
+    return dumps_bytes(obj).decode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask на orjson; без orjson — поведение по умолчанию."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = OPTIONS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=option),
+                                        mimetype=self.mimetype)
@@ -0,0 +1,73 @@
+"""Схлопывание одинаковых одновременных запросов (single-flight).
+
+Пока первый запрос с данным ключом (путь и параметры) вычисляет ответ,
+такие же запросы не повторяют SQL и обращения к Bot API, а ждут его
+результат. Результат — готовые (тело, статус, заголовки): объект ответа
+у каждого запроса свой. Ничего не кэшируется: следующий запрос после
+завершения вычисления выполняется заново (кэш — ResponseCache).
+"""
+import threading
+
+import metrics
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Для потоков (Flask под gunicorn gthread)."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, route=''):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.SINGLE_FLIGHT.inc(route=route, result='coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        metrics.SINGLE_FLIGHT.inc(route=route, result='leader')
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """Для asyncio (api_async). func — корутинная функция без аргументов."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, route=''):
+        # asyncio импортируется здесь: Flask-приложение его не загружает
+        import asyncio
+        task = self._calls.get(key)
+        if task is None:
+            metrics.SINGLE_FLIGHT.inc(route=route, result='leader')
+            # Отдельная задача: отмена запроса-лидера (клиент ушёл) не
+            # отменяет вычисление для остальных
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            metrics.SINGLE_FLIGHT.inc(route=route, result='coalesced')
+        return await asyncio.shield(task)
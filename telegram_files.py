@@ -0,0 +1,274 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import metrics
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Ссылка на файл от getFile живёт не меньше часа — кэшируем чуть меньше
+FILE_URL_TTL = 50 * 60
+# Ошибки кэшируем коротко, чтобы не долбить Telegram битым file_id
+NEGATIVE_TTL = 60
+
+# file_id, не разрешённые за бюджет в текущем запросе (см. track_timeouts)
+_timed_out = contextvars.ContextVar('photo_timed_out', default=None)
+
+
+@contextlib.contextmanager
+def track_timeouts():
+    """Собирает file_id, которым resolve_many поставил None по бюджету.
+
+    Ответ с такими заглушками нельзя кэшировать: настоящая ссылка придёт
+    в кэш резолвера через мгновение, а закэшированный ответ отдавал бы
+    null до конца своего TTL.
+    """
+    missed = []
+    token = _timed_out.set(missed)
+    try:
+        yield missed
+    finally:
+        _timed_out.reset(token)
+
+
+def _note_timeout(file_id):
+    missed = _timed_out.get()
+    if missed is not None:
+        missed.append(file_id)
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей."""
+
+    def __init__(self, maxsize=2048, ttl=FILE_URL_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает (найдено, значение)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _BaseResolver:
+    def __init__(self, token, api_url=None, timeout=3.0, budget=1.5,
+                 maxsize=2048, ttl=FILE_URL_TTL, negative_ttl=NEGATIVE_TTL):
+        self.token = token
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip('/')
+        self.timeout = timeout
+        self.budget = budget
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+
+    def _get_file_url(self):
+        return f'{self.api_url}/bot{self.token}/getFile'
+
+    def _remember(self, file_id, payload):
+        # payload — разобранный ответ getFile или None при ошибке
+        url = None
+        file_path = (payload or {}).get('result', {}).get('file_path')
+        if file_path:
+            url = f'{self.api_url}/file/bot{self.token}/{file_path}'
+            self.cache.set(file_id, url)
+        else:
+            self.cache.set(file_id, None, ttl=self.negative_ttl)
+        return url
+
+    def _split(self, file_ids):
+        # Делит file_id на найденные в кэше и промахи
+        result = {}
+        misses = []
+        for file_id in file_ids:
+            if not file_id or file_id in result or file_id in misses:
+                continue
+            hit, url = self.cache.get(file_id)
+            if hit:
+                result[file_id] = url
+            else:
+                misses.append(file_id)
+        return result, misses
+
+
+class PhotoResolver(_BaseResolver):
+    """Превращает file_id фотографий тренеров в ссылки на файлы Telegram.
+
+    Результаты (в том числе неудачные) кэшируются, промахи по списку
+    разрешаются параллельно в пределах общего бюджета времени.
+    """
+
+    def __init__(self, token, workers=8, **kwargs):
+        super().__init__(token, **kwargs)
+        self.workers = workers
+        # Сессия и пул потоков создаются при первом промахе кэша: requests
+        # не грузится на старте, а в preload_app ничего не переживает fork
+        self.session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='photo-resolver')
+
+    def _fetch(self, file_id):
+        import requests
+        payload = None
+        started = time.perf_counter()
+        try:
+            resp = self.session.get(self._get_file_url(), params={'file_id': file_id}, timeout=self.timeout)
+            if resp.status_code == 200:
+                payload = resp.json()
+        except (requests.RequestException, ValueError):
+            pass
+        metrics.record_telegram('getFile', time.perf_counter() - started, payload is not None)
+        url = self._remember(file_id, payload)
+        with self._lock:
+            self._inflight.pop(file_id, None)
+        return url
+
+    def _submit(self, file_id):
+        # Один и тот же file_id не запрашиваем дважды одновременно
+        with self._lock:
+            future = self._inflight.get(file_id)
+            if future is None:
+                if self._executor is None:
+                    self._start()
+                # Контекст запроса нужен, чтобы вызов попал в его метрики
+                future = self._executor.submit(contextvars.copy_context().run, self._fetch, file_id)
+                self._inflight[file_id] = future
+            return future
+
+    def resolve(self, file_id):
+        if not file_id:
+            return None
+        return self.resolve_many([file_id]).get(file_id)
+
+    def resolve_many(self, file_ids):
+        """Возвращает словарь file_id -> url (или None).
+
+        Не успевшие за бюджет запросы продолжают выполняться в фоне и
+        попадут в кэш к следующему обращению.
+        """
+        result, misses = self._split(file_ids)
+        pending = {file_id: self._submit(file_id) for file_id in misses}
+        if pending:
+            done, _ = wait(pending.values(), timeout=self.budget)
+            for file_id, future in pending.items():
+                if future in done:
+                    result[file_id] = future.result()
+                else:
+                    result[file_id] = None
+                    _note_timeout(file_id)
+        return result
+
+    def attach(self, items, key='photo', target='photo_url'):
+        """Проставляет ссылки на фото в список словарей одним пакетом."""
+        urls = self.resolve_many(item[key] for item in items if item.get(key))
+        for item in items:
+            item[target] = urls.get(item[key]) if item.get(key) else None
+        return items
+
+
+class AsyncPhotoResolver(_BaseResolver):
+    """Асинхронный вариант PhotoResolver для api_async на aiohttp."""
+
+    def __init__(self, token, limit=32, **kwargs):
+        super().__init__(token, **kwargs)
+        self.limit = limit
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.limit)
+            )
+        return self._session
+
+    async def _fetch(self, file_id):
+        import asyncio
+        import aiohttp
+        payload = None
+        started = time.perf_counter()
+        try:
+            async with self._get_session().get(self._get_file_url(), params={'file_id': file_id}) as resp:
+                if resp.status == 200:
+                    payload = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            pass
+        metrics.record_telegram('getFile', time.perf_counter() - started, payload is not None)
+        url = self._remember(file_id, payload)
+        self._inflight.pop(file_id, None)
+        return url
+
+    def _submit(self, file_id):
+        import asyncio
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = self._inflight[file_id] = asyncio.ensure_future(self._fetch(file_id))
+        return task
+
+    async def resolve(self, file_id):
+        if not file_id:
+            return None
+        return (await self.resolve_many([file_id])).get(file_id)
+
+    async def resolve_many(self, file_ids):
+        import asyncio
+        result, misses = self._split(file_ids)
+        pending = {file_id: self._submit(file_id) for file_id in misses}
+        if pending:
+            # asyncio.wait не отменяет задачи по таймауту: они докешируются в фоне
+            await asyncio.wait(pending.values(), timeout=self.budget)
+            for file_id, task in pending.items():
+                if task.done():
+                    result[file_id] = task.result()
+                else:
+                    result[file_id] = None
+                    _note_timeout(file_id)
+        return result
+
+    async def attach(self, items, key='photo', target='photo_url'):
+        urls = await self.resolve_many([item[key] for item in items if item.get(key)])
+        for item in items:
+            item[target] = urls.get(item[key]) if item.get(key) else None
+        return items
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()